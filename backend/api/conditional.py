@@ -0,0 +1,122 @@
+"""Модуль условных HTTP-запросов (ETag, Last-Modified) для API.
+
+Функции модуля передаются в декоратор django.views.decorators.http.condition
+и вычисляют версию ответа по дешевым данным: агрегатам таблицы рецептов,
+меткам версий справочников и наборов пользователя. Если версия совпадает
+с присланной клиентом, ответ 304 возвращается до сериализации.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+
+from django.db.models import Count, Max
+from recipes.cache import get_catalog_version, get_user_recipes
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            Subscription, Tag)
+from recipes.prefix_index import ingredient_index
+
+
+def make_etag(*parts):
+    """Возвращает строгий ETag для набора частей версии."""
+    return hashlib.sha1(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+def stamp_to_datetime(stamp):
+    """Переводит метку версии в наносекундах в дату и время."""
+    return datetime.fromtimestamp(stamp / 10 ** 9, tz=timezone.utc)
+
+
+def get_user_version(request):
+    """Возвращает версию данных, зависящих от текущего пользователя."""
+    user = request.user
+    if not user.is_authenticated:
+        return ('anonymous',)
+    favorites, _ = get_user_recipes(FavoriteRecipe, user.pk)
+    shopping_cart, _ = get_user_recipes(ShoppingCart, user.pk)
+    subscriptions = Subscription.objects.filter(user=user).aggregate(
+        count=Count('id'), last=Max('id')
+    )
+    return (
+        user.pk, favorites, shopping_cart,
+        subscriptions['count'], subscriptions['last'],
+    )
+
+
+def get_recipes_state(request, pk=None):
+    """Возвращает дату последнего изменения и число рецептов.
+
+    Результат запоминается в запросе, чтобы ETag и Last-Modified
+    вычислялись одним запросом к базе данных.
+    """
+    if not hasattr(request, 'recipes_state'):
+        recipes = Recipe.objects.all()
+        if pk is not None:
+            recipes = recipes.filter(pk=pk)
+        request.recipes_state = recipes.aggregate(
+            updated=Max('updated_at'), count=Count('id')
+        )
+    return request.recipes_state
+
+
+def recipes_etag(request, pk=None, **kwargs):
+    """ETag списка или отдельного рецепта."""
+    state = get_recipes_state(request, pk)
+    if state['updated'] is None:
+        return None
+    return make_etag(
+        state['updated'].isoformat(), state['count'],
+        get_catalog_version(Recipe), get_catalog_version(Tag),
+        get_catalog_version(Ingredient),
+        request.get_full_path(), *get_user_version(request),
+    )
+
+
+def recipes_last_modified(request, pk=None, **kwargs):
+    """Last-Modified рецептов, только для анонимных пользователей.
+
+    Для авторизованных ответ зависит еще и от подписок, у которых нет
+    даты изменения, поэтому для них используется только ETag. Удаление
+    рецепта учитывается меткой версии Recipe (см. recipes.signals).
+    """
+    if request.user.is_authenticated:
+        return None
+    updated = get_recipes_state(request, pk)['updated']
+    if updated is None:
+        return None
+    return max(
+        updated,
+        stamp_to_datetime(get_catalog_version(Recipe)),
+        stamp_to_datetime(get_catalog_version(Tag)),
+        stamp_to_datetime(get_catalog_version(Ingredient)),
+    )
+
+
+def get_process_catalog_version(model):
+    """Возвращает метку версии справочника без обращения к кэшу.
+
+    Для ингредиентов метка берется из префиксного индекса, который
+    перечитывает ее не чаще раза в INGREDIENT_INDEX_CHECK_INTERVAL
+    секунд, поэтому автодополнение не обращается к кэшу на каждый ввод.
+    """
+    if model is Ingredient:
+        return ingredient_index.get_version()
+    return get_catalog_version(model)
+
+
+def catalog_etag(model):
+    """Возвращает функцию ETag для справочника."""
+    def etag(request, *args, **kwargs):
+        return make_etag(
+            model._meta.model_name, get_process_catalog_version(model),
+            request.get_full_path(),
+        )
+    return etag
+
+
+def catalog_last_modified(model):
+    """Возвращает функцию Last-Modified для справочника."""
+    def last_modified(request, *args, **kwargs):
+        return stamp_to_datetime(get_process_catalog_version(model))
+    return last_modified
@@ -9,3 +9,64 @@ MAX_COOKING_TIME = 1440
 
 MIN_INGREDIENTS = 1
 MAX_INGREDIENTS = 10000
+
+RECIPE_CARD_TIMEOUT = 60 * 60 * 24
+USER_RECIPES_TIMEOUT = 60 * 60 * 24
+
+COOKING_TIME_BUCKETS = (
+    (MIN_COOKING_TIME, 15),
+    (16, 30),
+    (31, 60),
+    (61, 120),
+    (121, MAX_COOKING_TIME),
+)
+
+MAX_TAGS = 63
+
+FUZZY_SEARCH_MIN_RESULTS = 3
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+FUZZY_MAX_CANDIDATES = 100
+FUZZY_SCAN_BUDGET = 20000
+INGREDIENT_INDEX_CHECK_INTERVAL = 5
+
+CATALOG_SNAPSHOT_KEEP = 3
+CATALOG_SNAPSHOT_HASH_LENGTH = 12
+
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_SIZE = 50
+FEED_BATCH_SIZE = 1000
+FEED_MAX_ENTRIES = 1000
+
+MAX_BULK_IDS = 100
+
+MAX_IMAGE_UPLOAD_SIZE = 20 * 1024 * 1024
+IMAGE_SNIFF_LENGTH = 64
+IMAGE_MAX_SIDE = 2048
+IMAGE_JPEG_QUALITY = 85
+IMAGE_WEBP_QUALITY = 80
+IMAGE_RENDITIONS = (
+    ('thumbnail', 160),
+    ('card', 600),
+    ('full', 1280),
+)
+IMAGE_RENDITION_FORMATS = (
+    ('webp', 'WEBP'),
+    ('jpg', 'JPEG'),
+)
+IMAGE_STAGING_TTL = 60 * 60 * 24
+
+MEDIA_RELEASE_DELAY = 60 * 60 * 24
+
+JOB_WORKERS = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_TIMEOUT = 60 * 30
+JOB_RESULT_TTL = 60 * 60 * 24
+JOB_POLL_INTERVAL = 2
+JOB_MAX_PENDING = 5
+
+CATALOG_IMPORT_BATCH_SIZE = 1000
+CATALOG_IMPORT_READ_SIZE = 64 * 1024
+
+DATASET_BATCH_SIZE = 1000
+DATASET_PUBLISH_PERIOD = 60 * 60 * 24 * 365
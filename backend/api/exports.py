@@ -0,0 +1,38 @@
+"""Модуль обработчиков фоновых задач пользователя.
+
+Обработчики вызываются командой run_jobs (см. recipes.jobs) и
+возвращают имя и содержимое файла результата или None.
+"""
+
+import json
+
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
+from api.serializers import RecipeGetSerializer
+from recipes.models import Recipe
+from recipes.shopping_list import get_rows, rebuild
+
+SHOPPING_LIST_RENDERERS = {
+    renderer.format: renderer
+    for renderer in (ShoppingListTextRenderer, ShoppingListCSVRenderer,
+                     ShoppingListJSONRenderer)
+}
+
+
+def export_shopping_list(user, format='txt'):
+    """Выгружает список покупок пользователя в файл."""
+    renderer = SHOPPING_LIST_RENDERERS[format]()
+    return renderer.get_filename(), ''.join(renderer.stream(get_rows(user)))
+
+
+def export_recipes(user):
+    """Выгружает рецепты пользователя в JSON."""
+    recipes = Recipe.objects.with_related(user).filter(author=user)
+    return 'recipes.json', json.dumps(
+        RecipeGetSerializer(recipes, many=True).data, ensure_ascii=False
+    )
+
+
+def rebuild_shopping_list(user):
+    """Пересчитывает список покупок пользователя."""
+    rebuild([user.pk])
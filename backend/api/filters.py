@@ -1,5 +1,6 @@
 """Модуль для фильтрации поиска для API-запросов."""
 
+from api.constants import FUZZY_SEARCH_MIN_RESULTS
 from django.contrib.auth import get_user_model
 from django_filters import FilterSet
 from django_filters.rest_framework import filters
@@ -18,9 +19,15 @@ class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=(('any', 'Любой из тегов'), ('all', 'Все теги')),
+        method='filter_tags_match'
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    search = filters.CharFilter(method='filter_search')
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрует избранные рецепты."""
@@ -36,11 +43,33 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_cart__user=user)
         return queryset
 
-    def filter_by_tags(self, queryset, name, value):
-        """Фильтрует рецепты по тегам."""
-        tag_slugs = self.request.query_params.getlist('tags')
-        if tag_slugs:
-            return queryset.filter(tags__slug__in=tag_slugs).distinct()
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск, самые релевантные рецепты - первыми.
+
+        Если по тексту найдено меньше FUZZY_SEARCH_MIN_RESULTS рецептов,
+        поиск повторяется с учетом опечаток в названии.
+        """
+        recipes = queryset.search(value)
+        found = recipes.values('pk')[:FUZZY_SEARCH_MIN_RESULTS].count()
+        if found < FUZZY_SEARCH_MIN_RESULTS:
+            recipes = queryset.search(value, fuzzy=True)
+        return recipes.order_by('-search_rank', '-pub_date')
+
+    def filter_tags(self, queryset, name, value):
+        """Фильтрует рецепты по тегам через битовую маску тегов.
+
+        Параметр tags_match=all оставляет рецепты со всеми выбранными
+        тегами, по умолчанию достаточно любого из них.
+        """
+        if not value:
+            return queryset
+        return queryset.with_tags_mask(
+            Tag.mask_of(value),
+            match_all=self.form.cleaned_data.get('tags_match') == 'all'
+        )
+
+    def filter_tags_match(self, queryset, name, value):
+        """Режим сравнения тегов применяется в filter_tags."""
         return queryset
 
     class Meta:
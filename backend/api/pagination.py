@@ -1,6 +1,18 @@
 """Модуль для пагинации выдачи ответов API."""
 
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import and_, attrgetter, or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ApiPagination(PageNumberPagination):
@@ -9,7 +21,176 @@ class ApiPagination(PageNumberPagination):
     Позволяет управлять количеством объектов на странице
     через параметр 'limit'.
     По умолчанию возвращается 6 объектов на страницу.
+
+    Передача параметра 'cursor' (для первой страницы - пустого) включает
+    курсорный режим: выборка идет по ключу из полей `cursor_ordering`
+    представления без COUNT(*) и OFFSET, а в ответе возвращаются
+    непрозрачные ссылки 'next' и 'previous'. Для действий из
+    `cursor_actions` представления курсорный режим включен всегда.
+    Вместо набора можно передать список наборов с одинаковыми полями
+    ключа: их страницы сливаются в одну по ключу сортировки. Набор,
+    упорядоченный по аннотации (ранг поиска), всегда выдается
+    постранично.
     """
 
     page_size_query_param = "limit"
     page_size = 6
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pk',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Выбирает режим пагинации по наличию параметра курсора."""
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            or getattr(view, 'action', None)
+            in getattr(view, 'cursor_actions', ())
+        ) and not self.is_ordered_by_annotation(queryset)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request, view)
+
+    def paginate_keyset(self, queryset, request, view=None):
+        """Возвращает страницу, следующую за позицией курсора."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        position, reverse = self.decode_cursor(request)
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+
+        querysets = (
+            queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        )
+        if position is not None:
+            condition = self.keyset_filter(
+                querysets[0].model, ordering, position
+            )
+        results = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*ordering)
+            if position is not None:
+                queryset = queryset.filter(condition)
+            results.extend(queryset[:page_size + 1])
+        if len(querysets) > 1:
+            results = self.merge(results, ordering)
+        results = results[:page_size + 1]
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        has_next = position is not None if reverse else has_more
+        has_previous = has_more if reverse else position is not None
+        self.next_position = (
+            self.get_position(results[-1], ordering)
+            if results and has_next else None
+        )
+        self.previous_position = (
+            self.get_position(results[0], ordering)
+            if results and has_previous else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        """Формирует ответ с учетом режима пагинации."""
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_cursor_link(self.next_position, False)),
+            ('previous', self.get_cursor_link(self.previous_position, True)),
+            ('results', data),
+        ]))
+
+    @staticmethod
+    def is_ordered_by_annotation(queryset):
+        """Проверяет, упорядочен ли набор по аннотации.
+
+        Такой порядок (например, по рангу поиска search_rank) нельзя
+        сохранить ключом курсора, поэтому для набора используется
+        постраничная пагинация.
+        """
+        if isinstance(queryset, (list, tuple)):
+            return False
+        return any(
+            isinstance(field, str)
+            and field.lstrip('-') in queryset.query.annotations
+            for field in queryset.query.order_by
+        )
+
+    @classmethod
+    def merge(cls, results, ordering):
+        """Упорядочивает строки нескольких выборок и убирает повторы.
+
+        Строки с одинаковым ключом сортировки считаются одной строкой.
+        """
+        for field in reversed(ordering):
+            results.sort(
+                key=attrgetter(field.lstrip('-')),
+                reverse=field.startswith('-')
+            )
+        merged, last = [], None
+        for obj in results:
+            position = cls.get_position(obj, ordering)
+            if position != last:
+                merged.append(obj)
+                last = position
+        return merged
+
+    @staticmethod
+    def invert(field):
+        """Меняет направление сортировки поля."""
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def get_position(obj, ordering):
+        """Возвращает значения ключа сортировки для объекта."""
+        return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+    def keyset_filter(self, model, ordering, position):
+        """Строит условие "строго после позиции" для составного ключа."""
+        names = [field.lstrip('-') for field in ordering]
+        try:
+            values = [
+                model._meta.get_field(
+                    model._meta.pk.name if name == 'pk' else name
+                ).to_python(value)
+                for name, value in zip(names, position)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        conditions = []
+        for index, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = [
+                Q(**{name: value})
+                for name, value in zip(names[:index], values)
+            ]
+            conditions.append(reduce(
+                and_, equal, Q(**{f'{names[index]}__{lookup}': values[index]})
+            ))
+        return reduce(or_, conditions)
+
+    def decode_cursor(self, request):
+        """Декодирует позицию и направление из параметра курсора."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            return list(payload['p']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_link(self, position, reverse):
+        """Возвращает ссылку на страницу с закодированной позицией."""
+        if position is None:
+            return None
+        payload = json.dumps({'p': position, 'r': reverse}, default=str)
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode('ascii')
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
@@ -0,0 +1,87 @@
+"""Модуль рендереров списка покупок.
+
+Формат выбирается параметром ?format= (txt, csv, json) или заголовком
+Accept. Сам список отдается потоком методом stream() по строкам
+агрегированного запроса, рендер render() используется только
+для ответов с ошибками.
+"""
+
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingListRendererMixin:
+    """Общая часть рендереров списка покупок."""
+
+    def get_filename(self):
+        """Возвращает имя скачиваемого файла."""
+        return f'shopping_cart.{self.format}'
+
+    @staticmethod
+    def get_fields(row):
+        """Возвращает название, единицу измерения и количество."""
+        return (
+            row['ingredient__name'], row['ingredient__measurement_unit'],
+            row['amount'],
+        )
+
+
+class ShoppingListTextRenderer(ShoppingListRendererMixin, BaseRenderer):
+    """Список покупок в виде текста."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Выводит текст ошибки."""
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode(self.charset)
+
+    def stream(self, rows):
+        """Построчно выводит список покупок."""
+        yield 'Список покупок:\n'
+        for row in rows:
+            name, unit, amount = self.get_fields(row)
+            yield f'{name} — {amount} {unit}\n'
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        """Возвращает строку вместо записи."""
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        """Построчно выводит список покупок с заголовком."""
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(self.get_fields(row))
+
+
+class ShoppingListJSONRenderer(ShoppingListRendererMixin, JSONRenderer):
+    """Список покупок в формате JSON."""
+
+    def stream(self, rows):
+        """Выводит массив JSON по одному элементу."""
+        separator = '['
+        for row in rows:
+            name, unit, amount = self.get_fields(row)
+            yield separator + json.dumps(
+                {'name': name, 'measurement_unit': unit, 'amount': amount},
+                ensure_ascii=False,
+            )
+            separator = ','
+        yield ']' if separator == ',' else '[]'
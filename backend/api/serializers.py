@@ -1,44 +1,98 @@
 """Модуль сериализаторов API."""
 
-import base64
+import os
+from collections import Counter, defaultdict
 
-from api.constants import (MAX_COOKING_TIME, MAX_INGREDIENTS,
+from api.constants import (JOB_MAX_PENDING, MAX_BULK_IDS, MAX_COOKING_TIME,
+                           MAX_IMAGE_UPLOAD_SIZE, MAX_INGREDIENTS,
                            MAX_LENGTH_MIDDLE, MIN_COOKING_TIME,
                            MIN_INGREDIENTS)
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
 from django.core.validators import RegexValidator
-from django.db.models import F, Q
-from django.shortcuts import get_list_or_404, get_object_or_404
+from django.db import IntegrityError, transaction
+from django.db.models import Manager, prefetch_related_objects
+from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+from recipes.bulk import lock_user
+from recipes.cache import (get_recipe_card_version, get_recipe_cards,
+                           get_user_recipes, has_user_recipe,
+                           invalidate_recipe_cards, set_recipe_cards)
+from recipes.images import (IMAGE_ERRORS, check_image, get_pending_name,
+                            pop_staged_images, schedule_images, stage_image)
+from recipes.jobs import JOB_HANDLERS, JOB_PARAMS, get_pending_count
+from recipes.models import (FavoriteRecipe, Ingredient, Job, Recipe,
                             RecipeIngredient, RecipeTag, ShoppingCart,
                             Subscription, Tag)
+from recipes.shopping_list import change_recipes, diff
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
 User = get_user_model()
 
 
 class Base64ImageField(serializers.ImageField):
-    """Декодирование изображений, переданных в формате Base64."""
+    """Прием изображений, переданных в формате Base64.
+
+    В запросе изображение проверяется только по заголовку, а декодируется
+    и перекодируется в пуле процессов (см. recipes.images).
+    Сериализатор извлекает такие изображения перед сохранением объекта
+    функцией pop_staged_images и ставит их обработку функцией
+    schedule_images.
+    """
 
     def to_internal_value(self, data):
-        """Преобразует входные данные в объект изображения."""
+        """Проверяет строку Base64 и сохраняет ее для обработки."""
         if isinstance(data, str) and data.startswith('data:image'):
-            try:
-                format, imgstr = data.split(';base64,')
-                ext = format.split('/')[-1]
-                data = ContentFile(
-                    base64.b64decode(imgstr),
-                    name=f'temp.{ext}'
-                )
-            except (ValueError, IndexError, base64.binascii.Error) as error:
+            _, separator, payload = data.partition(';base64,')
+            if not separator or not payload:
                 raise serializers.ValidationError(
                     'Неверный формат Base64 изображения!'
-                ) from error
+                )
+            if len(payload) * 3 // 4 > MAX_IMAGE_UPLOAD_SIZE:
+                raise serializers.ValidationError(
+                    'Размер изображения не должен превышать '
+                    f'{MAX_IMAGE_UPLOAD_SIZE // (1024 * 1024)} МБ!'
+                )
+            try:
+                check_image(payload)
+            except IMAGE_ERRORS:
+                raise serializers.ValidationError(
+                    'Загрузите корректное изображение!'
+                )
+            return stage_image(payload)
         return super().to_internal_value(data)
 
 
+def get_pending_image_urls(request, pending_images):
+    """Возвращает адреса изображений, которые еще обрабатываются.
+
+    pending_images - словарь {поле: путь файла задачи} из
+    schedule_images. Для выполненных задач адрес не возвращается:
+    поле объекта уже указывает на готовый файл.
+    """
+    return {
+        field_name: reverse(
+            'pending-image', kwargs={'name': get_pending_name(path)},
+            request=request,
+        )
+        for field_name, path in pending_images.items()
+        if os.path.exists(path)
+    }
+
+
+def get_followed_ids(request):
+    """Возвращает id авторов, на которых подписан текущий пользователь.
+
+    Множество читается одним запросом и запоминается в запросе, чтобы
+    все вложенные сериализаторы пользователей ответа использовали его.
+    """
+    if not hasattr(request, 'followed_ids'):
+        request.followed_ids = frozenset(Subscription.objects.filter(
+            user=request.user
+        ).values_list('author_id', flat=True))
+    return request.followed_ids
+
+
 class UserPostSerializer(UserCreateSerializer):
     """Сериализатор для создания нового пользователя через API."""
 
@@ -94,11 +148,28 @@ class UserGetSerializer(UserSerializer):
                 raise serializers.ValidationError('Выберите фото для аватара!')
         return data
 
+    def update(self, instance, validated_data):
+        """Обновляет пользователя, откладывая обработку аватара."""
+        staged_images = pop_staged_images(validated_data)
+        instance = super().update(instance, validated_data)
+        self.pending_images = schedule_images(instance, staged_images)
+        if staged_images:
+            instance.refresh_from_db(fields=list(staged_images))
+        return instance
+
+    def to_representation(self, instance):
+        """Подставляет адреса еще не обработанных изображений."""
+        data = super().to_representation(instance)
+        data.update(get_pending_image_urls(
+            self.context.get('request'), getattr(self, 'pending_images', {})
+        ))
+        return data
+
     def get_is_subscribed(self, obj):
         """Определяет, подписан ли текущий пользователь на данного."""
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.followers.filter(user=request.user).exists()
+            return obj.pk in get_followed_ids(request)
         return False
 
     def get_avatar(self, obj):
@@ -116,7 +187,7 @@ class TagSerializer(serializers.ModelSerializer):
         """Метаданные сериализатора."""
 
         model = Tag
-        fields = ('__all__')
+        fields = ('id', 'name', 'slug')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -129,6 +200,93 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('__all__')
 
 
+def get_rendition_urls(recipe, build_url=None):
+    """Возвращает адреса уменьшенных копий фото рецепта.
+
+    Результат - словарь {размер: {расширение: адрес}}, пустой, пока
+    копии не созданы (см. recipes.images).
+    """
+    storage = recipe.image.storage
+    return {
+        name: {
+            extension: (build_url or str)(storage.url(filename))
+            for extension, filename in formats.items()
+        }
+        for name, formats in recipe.image_renditions.items()
+    }
+
+
+class RecipeCardListSerializer(serializers.ListSerializer):
+    """Список рецептов, собираемый из кэша карточек.
+
+    Карточки всей страницы читаются из кэша одним обращением, а связи
+    догружаются только для отсутствующих в кэше рецептов.
+    """
+
+    def to_representation(self, data):
+        """Загружает карточки страницы и сериализует рецепты."""
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        self.child.load_cards(recipes)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
+class RecipeCardSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор карточки рецепта.
+
+    Карточка - не зависящая от пользователя часть ответа, которая хранится
+    в кэше (см. recipes.cache). Сериализуется без запроса в контексте,
+    поэтому ссылки на изображения в ней относительные.
+    """
+
+    author = UserGetSerializer(help_text="Информация об авторе рецепта.")
+    tags = TagSerializer(
+        many=True, help_text="Список тегов, связанных с рецептом."
+    )
+    ingredients = serializers.SerializerMethodField(
+        help_text="Список ингредиентов с их количеством."
+    )
+    images = serializers.SerializerMethodField(
+        help_text="Уменьшенные копии фото рецепта."
+    )
+
+    class Meta:
+        """Метаданные сериализатора."""
+
+        model = Recipe
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'name',
+            'image',
+            'images',
+            'text',
+            'cooking_time'
+        )
+
+    def get_images(self, obj):
+        """Возвращает относительные адреса уменьшенных копий фото."""
+        return get_rendition_urls(obj)
+
+    def get_ingredients(self, obj):
+        """Возвращает список ингредиентов рецепта с их количеством.
+
+        Ингредиенты берутся из предзагруженных связей RecipeIngredient,
+        см. RecipeQuerySet.card_prefetches.
+        """
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in obj.ingredients_recipe.all()
+        ]
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
     """
     Сериализатор для получения информации о рецептах через API.
@@ -138,15 +296,12 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     - Тегах, связанных с рецептом.
     - Ингредиентах и их количестве.
     - Наличии рецепта в избранном и в корзине покупок.
+
+    Общая для всех пользователей часть берется из кэша карточек,
+    к ней добавляются только признаки текущего пользователя.
     """
 
     author = UserGetSerializer(help_text="Информация об авторе рецепта.")
-    tags = TagSerializer(
-        many=True, help_text="Список тегов, связанных с рецептом."
-    )
-    ingredients = serializers.SerializerMethodField(
-        help_text="Список ингредиентов с их количеством."
-    )
     is_favorited = serializers.SerializerMethodField(
         help_text="Показывает, добавлен ли рецепт"
         "в избранное текущим пользователем."
@@ -155,6 +310,9 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         help_text="Показывает, находится ли рецепт"
         "в корзине покупок текущего пользователя."
     )
+    images = serializers.JSONField(
+        read_only=True, help_text="Уменьшенные копии фото рецепта."
+    )
 
     class Meta:
         """Метаданные сериализатора."""
@@ -169,36 +327,80 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time'
         )
+        list_serializer_class = RecipeCardListSerializer
+
+    def load_cards(self, recipes):
+        """Загружает карточки рецептов из кэша, собирая недостающие."""
+        version = get_recipe_card_version()
+        cards = get_recipe_cards([recipe.pk for recipe in recipes], version)
+        missing = [recipe for recipe in recipes if recipe.pk not in cards]
+        if missing:
+            prefetch_related_objects(
+                missing, *Recipe.objects.card_prefetches()
+            )
+            built = {
+                recipe.pk: RecipeCardSerializer(recipe).data
+                for recipe in missing
+            }
+            set_recipe_cards(built, version)
+            cards.update(built)
+        self.cards = {**getattr(self, 'cards', {}), **cards}
+
+    def build_absolute_url(self, url):
+        """Возвращает абсолютный URL для относительной ссылки карточки."""
+        request = self.context.get('request')
+        if url and request:
+            return request.build_absolute_uri(url)
+        return url
 
-    def get_ingredients(self, obj):
-        """Возвращает список ингредиентов рецепта с их количеством."""
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('recipeingredient__amount')
+    def get_author_is_subscribed(self, obj):
+        """Определяет, подписан ли текущий пользователь на автора."""
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
+        return self.fields['author'].get_is_subscribed(obj.author)
+
+    def to_representation(self, instance):
+        """Объединяет карточку рецепта с признаками текущего пользователя."""
+        if instance.pk not in getattr(self, 'cards', {}):
+            self.load_cards([instance])
+        card = self.cards[instance.pk]
+        author = dict(
+            card['author'],
+            is_subscribed=self.get_author_is_subscribed(instance),
+            avatar=self.build_absolute_url(card['author']['avatar']),
+        )
+        data = dict(
+            card,
+            author=author,
+            image=self.build_absolute_url(card['image']),
+            images={
+                name: {
+                    extension: self.build_absolute_url(url)
+                    for extension, url in formats.items()
+                }
+                for name, formats in card['images'].items()
+            },
+            is_favorited=self.get_is_favorited(instance),
+            is_in_shopping_cart=self.get_is_in_shopping_cart(instance),
         )
+        return {field: data[field] for field in self.Meta.fields}
 
     def get_recipe(self, obj, model):
-        """Связан ли рецепт с текущим пользователемчерез указанную модель."""
-        request = self.context.get('request')
-        if request and not request.user.is_anonymous:
-            return model.objects.filter(user=request.user, recipe=obj).exists()
-        return False
+        """Связан ли рецепт с текущим пользователемчерез указанную модель.
 
-    def filter_queryset_by_tags(self, queryset):
-        """Фильтрует рецепты по тегам с использованием логики OR."""
+        Набор рецептов пользователя загружается один раз на сериализацию.
+        """
         request = self.context.get('request')
-        tag_slugs = request.query_params.getlist('tags')
-        if tag_slugs:
-            query = Q()
-            for slug in tag_slugs:
-                query |= Q(tags__slug=slug)
-            return queryset.filter(query).distinct()
-        return queryset
+        if not request or request.user.is_anonymous:
+            return False
+        user_recipes = self.context.setdefault('user_recipes', {})
+        if model not in user_recipes:
+            _, user_recipes[model] = get_user_recipes(model, request.user.pk)
+        return has_user_recipe(user_recipes[model], obj.pk)
 
     def get_is_favorited(self, obj):
         """Проверяет, добавлен ли рецепт в избранное текущим пользователем."""
@@ -212,8 +414,7 @@ class RecipeGetSerializer(serializers.ModelSerializer):
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления или изменения ингредиентов в рецепте."""
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
+    id = serializers.IntegerField(
         help_text='Идентификатор существующего ингредиента.'
     )
     amount = serializers.IntegerField(
@@ -231,12 +432,30 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+def get_objects(model, ids, name):
+    """Загружает объекты модели по списку id одним запросом.
+
+    Повторяющиеся и отсутствующие в базе id собираются за один проход
+    и перечисляются в ошибке валидации. Возвращает объекты в порядке id.
+    """
+    objects = model.objects.in_bulk(ids)
+    duplicates = [pk for pk, count in Counter(ids).items() if count > 1]
+    missing = [pk for pk in dict.fromkeys(ids) if pk not in objects]
+    errors = []
+    if duplicates:
+        errors.append(f'{name} не должны повторяться: {duplicates}')
+    if missing:
+        errors.append(f'{name} не найдены: {missing}')
+    if errors:
+        raise serializers.ValidationError(errors)
+    return [objects[pk] for pk in ids]
+
+
 class RecipePostSerializer(serializers.ModelSerializer):
     """Сериализатор для создания и обновления рецептов через POST/PATCH."""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
         required=True,
         allow_null=False,
         allow_empty=False,
@@ -273,93 +492,205 @@ class RecipePostSerializer(serializers.ModelSerializer):
         """Проверка данных рецепта.
 
         1. Проверка наличия тегов в рецепте.
-        2. Теги не должны повторяться.
-        3. Проверка наличия ингредиентов в рецепте.
-        4. Ингредиенты не должны повторяться.
-        5. Проверка существования тегов и ингредиентов в базе данных.
+        2. Проверка наличия ингредиентов в рецепте.
+        3. Теги и ингредиенты не должны повторяться и должны
+           существовать в базе данных.
+
+        Теги и ингредиенты загружаются одним запросом каждые,
+        id заменяются найденными объектами. При частичном обновлении
+        непереданные теги и ингредиенты не проверяются и не меняются.
         """
         tags = data.get('tags')
-        if not tags:
+        if not tags and not (self.partial and 'tags' not in data):
             raise serializers.ValidationError(
                 {'tags': 'Рецепт не может быть без тегов!'}
             )
-
-        tags_list = [tag.id for tag in tags]
-        if len(tags_list) != len(set(tags_list)):
-            raise serializers.ValidationError(
-                {'tags': 'Теги не должны повторяться!'}
-            )
-
         ingredients = data.get('ingredients')
-        if not ingredients:
+        if not ingredients and not (
+            self.partial and 'ingredients' not in data
+        ):
             raise serializers.ValidationError(
                 {'ingredients': 'Рецепт не может быть без ингредиентов!'}
             )
 
-        ingredients_list = [item['id'].id for item in ingredients]
-        if len(ingredients_list) != len(set(ingredients_list)):
-            raise serializers.ValidationError(
-                {'ingredients': 'Ингредиенты не должны повторяться!'}
-            )
-
-        get_list_or_404(Tag, id__in=tags_list)
-        get_list_or_404(Ingredient, id__in=ingredients_list)
-
+        errors = {}
+        if tags:
+            try:
+                data['tags'] = get_objects(Tag, tags, 'Теги')
+            except serializers.ValidationError as error:
+                errors['tags'] = error.detail
+        if ingredients:
+            try:
+                objects = get_objects(
+                    Ingredient, [item['id'] for item in ingredients],
+                    'Ингредиенты'
+                )
+            except serializers.ValidationError as error:
+                errors['ingredients'] = error.detail
+        if errors:
+            raise serializers.ValidationError(errors)
+        if ingredients:
+            for item, ingredient in zip(ingredients, objects):
+                item['id'] = ingredient
         return data
 
-    def add_tags_ingredients(self, recipe, tags, ingredients):
-        """Удаление старых тегов и ингредиентов, а затем добавление новых."""
-        RecipeTag.objects.filter(recipe=recipe).delete()
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-
-        RecipeTag.objects.bulk_create([
-            RecipeTag(recipe=recipe, tag=tag) for tag in tags
-        ])
+    def set_tags(self, recipe, tags):
+        """Приводит теги рецепта к переданному набору.
 
+        Удаляются и добавляются только отличающиеся теги. Теги
+        сохраняются и в связь Recipe.tags, по которой они читаются.
+        Связь и маска тегов приводятся к набору, даже если строки
+        RecipeTag не изменились: у рецептов, созданных до маски, они
+        могут расходиться с RecipeTag.
+        """
+        current = set(RecipeTag.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        new = {tag.pk for tag in tags}
+        if current - new:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=current - new
+            ).delete()
+        if new - current:
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipe=recipe, tag=tag)
+                for tag in tags if tag.pk not in current
+            ])
+        recipe.tags.set(tags)
+        mask = Tag.mask_of(tags)
+        if recipe.tags_mask != mask:
+            Recipe.objects.filter(pk=recipe.pk).update(tags_mask=mask)
+            recipe.tags_mask = mask
+
+    def set_ingredients(self, recipe, ingredients):
+        """Приводит ингредиенты рецепта к переданному списку.
+
+        Удаляются, изменяются и добавляются только отличающиеся строки.
+        Удаление вычитается из списков покупок обработчиком pre_delete,
+        bulk_update и bulk_create сигналы не отправляют, поэтому их
+        разность переносится в списки покупок явно.
+        """
+        amounts = {item['id'].pk: item['amount'] for item in ingredients}
+        current = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        kept = {
+            key: item.amount for key, item in current.items()
+            if key not in removed
+        }
+        changed = [
+            item for key, item in current.items()
+            if key in kept and item.amount != amounts[key]
+        ]
+        for item in changed:
+            item.amount = amounts[item.ingredient_id]
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
         RecipeIngredient.objects.bulk_create([
             RecipeIngredient(
                 recipe=recipe,
                 ingredient=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients
+            if ingredient['id'].pk not in current
         ])
+        change_recipes({recipe.pk: diff(kept, amounts)})
 
+    def set_relations(self, recipe, tags, ingredients):
+        """Сохраняет переданные теги и ингредиенты рецепта.
+
+        Карточка рецепта сбрасывается еще раз после фиксации транзакции,
+        чтобы в кэш не попала карточка, прочитанная до нее.
+        """
+        if tags is not None:
+            self.set_tags(recipe, tags)
+        if ingredients is not None:
+            self.set_ingredients(recipe, ingredients)
+        transaction.on_commit(lambda: invalidate_recipe_cards([recipe.pk]))
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание нового рецепта с привязкой тегов и ингредиентов."""
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        staged_images = pop_staged_images(validated_data)
         recipe = Recipe.objects.create(**validated_data)
-        self.add_tags_ingredients(recipe, tags, ingredients)
+        self.set_relations(recipe, tags, ingredients)
+        self.pending_images = schedule_images(recipe, staged_images)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновление рецепта с возможностью изменить теги и ингредиенты."""
-        tags = validated_data.pop('tags', [])
-        ingredients = validated_data.pop('ingredients', [])
+        """Обновление рецепта.
+
+        Теги и ингредиенты меняются, только если они переданы.
+        """
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        staged_images = pop_staged_images(validated_data)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        self.add_tags_ingredients(instance, tags, ingredients)
+        self.set_relations(instance, tags, ingredients)
 
         instance.save()
+        self.pending_images = schedule_images(instance, staged_images)
         return instance
 
     def to_representation(self, instance):
         """Преобразование данных рецепта в формат ответа."""
-        return RecipeGetSerializer(instance).data
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related(
+            request.user if request else None
+        ).get(pk=instance.pk)
+        data = RecipeGetSerializer(instance, context=self.context).data
+        data.update(get_pending_image_urls(
+            request, getattr(self, 'pending_images', {})
+        ))
+        return data
 
 
 class RecipeListSerializer(serializers.ModelSerializer):
-    """GET-сериализатор для отображения мини-рецептов."""
+    """GET-сериализатор для отображения мини-рецептов.
 
-    image = Base64ImageField(required=True, allow_null=False)
+    Вместо исходного фото отдается его копия card в JPEG, пока копий
+    нет - исходное фото. Все копии перечислены в поле images.
+    """
+
+    image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         """Метаданные сериализатора."""
 
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+    def build_absolute_url(self, url):
+        """Возвращает абсолютный URL, если в контексте есть запрос."""
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image(self, obj):
+        """Возвращает адрес копии фото для карточки."""
+        card = obj.image_renditions.get('card', {}).get('jpg')
+        if card:
+            return self.build_absolute_url(obj.image.storage.url(card))
+        if obj.image:
+            return self.build_absolute_url(obj.image.url)
+        return None
+
+    def get_images(self, obj):
+        """Возвращает адреса всех копий фото."""
+        return get_rendition_urls(obj, self.build_absolute_url)
 
 
 class UserRecepieSerializer(serializers.Serializer):
@@ -405,14 +736,108 @@ class UserRecepieSerializer(serializers.Serializer):
         Если рецепт не существует, выбрасывает ошибку.
         """
         model = self.context.get('model')
+        user = self.context['request'].user
         recipe = get_object_or_404(Recipe, pk=validated_data.get('pk'))
-        model.objects.create(
-            user=self.context['request'].user,
-            recipe=recipe
-        )
+        try:
+            with transaction.atomic():
+                lock_user(user.pk)
+                model.objects.create(user=user, recipe=recipe)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                'Данный рецепт уже существует!'
+            )
         return RecipeListSerializer(recipe)
 
 
+class BulkChangeSerializer(serializers.Serializer):
+    """Сериализатор пакетного добавления и удаления по списку id."""
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=MAX_BULK_IDS,
+        help_text='Id для добавления.'
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=MAX_BULK_IDS,
+        help_text='Id для удаления.'
+    )
+
+    def validate(self, data):
+        """Убирает повторы и проверяет, что списки не пересекаются."""
+        add = list(dict.fromkeys(data.get('add', ())))
+        remove = list(dict.fromkeys(data.get('remove', ())))
+        if not add and not remove:
+            raise serializers.ValidationError(
+                'Передайте id в списках add или remove!'
+            )
+        if both := sorted(set(add) & set(remove)):
+            raise serializers.ValidationError(
+                f'Id не могут одновременно добавляться и удаляться: {both}'
+            )
+        return {'add': add, 'remove': remove}
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Сериализатор фоновой задачи пользователя."""
+
+    kind = serializers.ChoiceField(
+        choices=tuple(JOB_HANDLERS), help_text='Тип задачи.'
+    )
+    params = serializers.DictField(
+        required=False, help_text='Параметры задачи.'
+    )
+    download_url = serializers.SerializerMethodField(
+        help_text='Адрес результата выполненной задачи.'
+    )
+
+    class Meta:
+        """Метаданные сериализатора."""
+
+        model = Job
+        fields = (
+            'id', 'kind', 'params', 'status', 'attempts', 'error',
+            'created_at', 'finished_at', 'expires_at', 'download_url',
+        )
+        read_only_fields = (
+            'status', 'attempts', 'error', 'created_at', 'finished_at',
+            'expires_at',
+        )
+
+    def validate(self, data):
+        """Проверяет параметры задачи и размер очереди пользователя."""
+        allowed = JOB_PARAMS[data['kind']]
+        params = data.setdefault('params', {})
+        unknown = sorted(params.keys() - allowed.keys())
+        if unknown:
+            raise serializers.ValidationError(
+                {'params': f'Неизвестные параметры: {unknown}'}
+            )
+        for name, value in params.items():
+            if value not in allowed[name]:
+                raise serializers.ValidationError(
+                    {'params': f'{name} должен быть одним из {allowed[name]}'}
+                )
+        user = self.context['request'].user
+        if get_pending_count(user) >= JOB_MAX_PENDING:
+            raise serializers.ValidationError(
+                f'Не больше {JOB_MAX_PENDING} задач в очереди!'
+            )
+        data['user'] = user
+        return data
+
+    def get_download_url(self, obj):
+        """Возвращает адрес скачивания результата, если он готов."""
+        if obj.status != Job.DONE or not obj.result:
+            return None
+        return reverse(
+            'jobs-download', args=(obj.pk,),
+            request=self.context.get('request')
+        )
+
+
 class SubscriptionSerializer(serializers.Serializer):
     """Сериализатор для обработки POST-запросов на создание подписки."""
 
@@ -469,6 +894,16 @@ class SubscriptionSerializer(serializers.Serializer):
         ).data
 
 
+class UserSubscriptionsListSerializer(serializers.ListSerializer):
+    """Список подписок, рецепты авторов которого читаются одним запросом."""
+
+    def to_representation(self, data):
+        """Загружает рецепты авторов страницы и сериализует их."""
+        authors = list(data.all() if isinstance(data, Manager) else data)
+        self.child.load_recipes(authors)
+        return [self.child.to_representation(author) for author in authors]
+
+
 class UserSubscriptionsSerializer(serializers.ModelSerializer):
     """Сериализатор для получения подписок пользователей."""
 
@@ -491,17 +926,36 @@ class UserSubscriptionsSerializer(serializers.ModelSerializer):
             'recipes_count',
             'avatar',
         )
+        list_serializer_class = UserSubscriptionsListSerializer
+
+    def load_recipes(self, authors):
+        """Загружает новые рецепты авторов, не больше limit_param на автора.
+
+        См. RecipeQuerySet.latest_per_author.
+        """
+        recipes = defaultdict(list)
+        for recipe in Recipe.objects.filter(author__in=authors).only(
+            'id', 'author', 'name', 'image', 'image_renditions',
+            'cooking_time'
+        ).latest_per_author(self.context.get('limit_param')):
+            recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = recipes[author.pk]
 
     def get_recipes_count(self, obj):
-        """Получение количества рецептов пользователя."""
+        """Получение количества рецептов пользователя.
+
+        В списке подписок количество аннотировано в запросе страницы.
+        """
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
         """Получение списка рецептов пользователя."""
-        recipes = obj.recipes.all()
-
-        if limit_param := self.context.get('limit_param'):
-            recipes = recipes[:int(limit_param)]
-
-        serializer = RecipeListSerializer(recipes, many=True, read_only=True)
+        if not hasattr(obj, 'latest_recipes'):
+            self.load_recipes([obj])
+        serializer = RecipeListSerializer(
+            obj.latest_recipes, many=True, read_only=True
+        )
         return serializer.data
@@ -3,7 +3,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, JobViewSet, RecipeViewSet, TagViewSet,
+                    UserViewSet, pending_image_view)
 
 v1_router = DefaultRouter()
 
@@ -11,9 +12,11 @@ v1_router.register(r'users', UserViewSet, basename='users')
 v1_router.register(r'recipes', RecipeViewSet, basename='recipes')
 v1_router.register(r'tags', TagViewSet, basename='tags')
 v1_router.register(r'ingredients', IngredientViewSet, basename='ingredients')
+v1_router.register(r'jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
+    path('images/<str:name>/', pending_image_view, name='pending-image'),
     path('', include(v1_router.urls)),
 ]
@@ -1,27 +1,49 @@
 """Модуль представлений API."""
 
+import os
+from itertools import chain
+
 import short_url
+from api.conditional import (catalog_etag, catalog_last_modified, recipes_etag,
+                             recipes_last_modified)
+from api.constants import COOKING_TIME_BUCKETS
 from api.filters import IngredientFilter, RecipeFilter
 from api.pagination import ApiPagination
 from api.permissions import IsOwnerOrAdmin
-from api.serializers import (IngredientSerializer, RecipeGetSerializer,
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTextRenderer)
+from api.serializers import (BulkChangeSerializer, IngredientSerializer,
+                             JobSerializer, RecipeGetSerializer,
                              RecipePostSerializer, SubscriptionSerializer,
                              TagSerializer, UserGetSerializer,
                              UserRecepieSerializer,
                              UserSubscriptionsSerializer)
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, Q
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Subscription, Tag,
-                            User)
-from rest_framework import viewsets
+from recipes.bulk import change_subscriptions, change_user_recipes, lock_user
+from recipes.feed import get_timeline
+from recipes.images import get_processed_url, read_pending
+from recipes.models import (FavoriteRecipe, Ingredient, Job, Recipe,
+                            ShoppingCart, Subscription, Tag, User)
+from recipes.prefix_index import ingredient_index
+from recipes.shopping_list import get_rows
+from recipes.snapshots import get_snapshot
+from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED,
-                                   HTTP_204_NO_CONTENT)
+                                   HTTP_202_ACCEPTED, HTTP_204_NO_CONTENT,
+                                   HTTP_409_CONFLICT)
 
 from foodgram import settings
 
@@ -37,6 +59,36 @@ def redirect_view(request, s):
     return redirect(f'/recipes/{pk}/')
 
 
+def pending_image_view(request, name):
+    """
+    Отдает загруженное изображение, которое еще обрабатывается.
+
+    После обработки перенаправляет на готовый файл (см. recipes.images).
+    """
+    pending = read_pending(name)
+    if pending is not None:
+        content, content_type = pending
+        response = HttpResponse(
+            content, content_type=content_type or 'application/octet-stream'
+        )
+        response['Cache-Control'] = 'no-store'
+        return response
+    url = get_processed_url(name)
+    if url is None:
+        raise Http404
+    return redirect(url)
+
+
+def get_limit_param(request, name):
+    """Возвращает положительное целое из параметра запроса или None."""
+    limit = request.query_params.get(name)
+    if limit is None:
+        return None
+    if not limit.isdigit() or int(limit) < 1:
+        raise ValidationError({name: 'Укажите целое положительное число.'})
+    return int(limit)
+
+
 class UserViewSet(DjoserUserViewSet):
     """
     ViewSet для работы с пользователями и подписками.
@@ -52,6 +104,7 @@ class UserViewSet(DjoserUserViewSet):
 
     queryset = User.objects.all()
     pagination_class = ApiPagination
+    cursor_ordering = ('id',)
     serializer_class = UserGetSerializer
 
     def get_serializer_class(self):
@@ -122,14 +175,22 @@ class UserViewSet(DjoserUserViewSet):
     @avatar.mapping.delete
     def delete_avatar(self, request):
         """Удаление аватара у текущего пользователя."""
-        User.objects.filter(pk=request.user.id).update(avatar=None)
+        request.user.avatar = None
+        request.user.save(update_fields=('avatar',))
         return Response(status=HTTP_204_NO_CONTENT)
 
     @action(detail=False, permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        """Возвращение списка подписок текущего пользователя."""
-        users = User.objects.filter(followers__user=request.user)
-        limit_param = request.query_params.get('recipes_limit')
+        """Возвращение списка подписок текущего пользователя.
+
+        Число рецептов авторов считается в запросе страницы, а их новые
+        рецепты (не больше recipes_limit) читаются одним запросом
+        для всей страницы.
+        """
+        limit_param = get_limit_param(request, 'recipes_limit')
+        users = User.objects.filter(followers__user=request.user).annotate(
+            recipes_count=Count('recipes', distinct=True)
+        ).order_by(*User._meta.ordering)
         paginated_queryset = self.paginate_queryset(users)
         serializer = UserSubscriptionsSerializer(
             paginated_queryset,
@@ -138,6 +199,16 @@ class UserViewSet(DjoserUserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @subscriptions.mapping.post
+    def bulk_subscriptions(self, request):
+        """Пакетная подписка и отписка по спискам id авторов."""
+        serializer = BulkChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response(change_subscriptions(
+            request.user, data['add'], data['remove']
+        ), status=HTTP_200_OK)
+
     @action(detail=True, permission_classes=(IsAuthenticated,))
     def subscribe(self, request, id):
         """Операции подписки и отписки от пользователя."""
@@ -146,7 +217,7 @@ class UserViewSet(DjoserUserViewSet):
     @subscribe.mapping.post
     def create_subs(self, request, id):
         """Операция подписки на пользователя."""
-        limit_param = request.query_params.get('recipes_limit')
+        limit_param = get_limit_param(request, 'recipes_limit')
         serializer = SubscriptionSerializer(
             data=request.data,
             context={
@@ -180,18 +251,63 @@ class UserViewSet(DjoserUserViewSet):
         return Response(status=HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+tags_condition = condition(
+    etag_func=catalog_etag(Tag),
+    last_modified_func=catalog_last_modified(Tag),
+)
+ingredients_condition = condition(
+    etag_func=catalog_etag(Ingredient),
+    last_modified_func=catalog_last_modified(Ingredient),
+)
+recipes_condition = condition(
+    etag_func=recipes_etag,
+    last_modified_func=recipes_last_modified,
+)
+
+
+class CatalogSnapshotMixin:
+    """Сообщает клиенту текущую версию статического снимка справочника.
+
+    Адрес снимка передается в заголовке Link, хэш содержимого -
+    в заголовке X-Catalog-Version.
+    """
+
+    snapshot_name = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Добавляет заголовки снимка к ответу."""
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        snapshot = get_snapshot(self.snapshot_name)
+        if snapshot and response.status_code < 400:
+            response['Link'] = (
+                f'<{request.build_absolute_uri(snapshot["url"])}>; '
+                'rel="alternate"; type="application/json"'
+            )
+            response['X-Catalog-Version'] = snapshot['sha256']
+        return response
+
+
+@method_decorator(tags_condition, name='list')
+@method_decorator(tags_condition, name='retrieve')
+class TagViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     """Read-only ViewSet для работы с тегами."""
 
+    snapshot_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+@method_decorator(ingredients_condition, name='list')
+@method_decorator(ingredients_condition, name='retrieve')
+class IngredientViewSet(CatalogSnapshotMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Read-only ViewSet для работы с ингредиентами."""
 
+    snapshot_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -200,7 +316,24 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ['name']
 
+    def list(self, request, *args, **kwargs):
+        """Список ингредиентов.
+
+        Поиск по началу названия (параметр name) выполняется
+        по префиксному индексу в памяти без обращения к базе данных,
+        параметр limit ограничивает число результатов.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return Response(
+            ingredient_index.search(name, get_limit_param(request, 'limit')),
+            status=HTTP_200_OK
+        )
+
 
+@method_decorator(recipes_condition, name='list')
+@method_decorator(recipes_condition, name='retrieve')
 class RecipeViewSet(viewsets.ModelViewSet):
     """CRUD-операции для рецептов."""
 
@@ -208,19 +341,129 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     pagination_class = ApiPagination
+    cursor_actions = ('feed',)
+
+    @property
+    def cursor_ordering(self):
+        """Ключ курсорной пагинации.
+
+        Записи ленты и рецепты авторов без рассылки сливаются по дате
+        публикации и id рецепта, см. recipes.feed.get_timeline.
+        """
+        if self.action == 'feed':
+            return ('-pub_date', '-recipe_id')
+        return ('-pub_date', '-id')
 
     def get_permissions(self):
         """Устанавливает разрешения для действий."""
-        if self.action in ('list', 'retrieve', 'get_short_link'):
+        if self.action in ('list', 'retrieve', 'get_short_link', 'facets'):
             return (AllowAny(),)
         return (IsAuthenticated(), IsOwnerOrAdmin())
 
+    def get_queryset(self):
+        """Выборка рецептов с предзагрузкой связей для чтения."""
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.with_related(self.request.user)
+        return super().get_queryset()
+
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия."""
         if self.action in ('list', 'retrieve'):
             return RecipeGetSerializer
         return RecipePostSerializer
 
+    @action(detail=False, permission_classes=(AllowAny,))
+    @method_decorator(recipes_condition)
+    def facets(self, request):
+        """Количество рецептов по тегам и интервалам времени приготовления.
+
+        Счетчики тегов учитывают все фильтры, кроме самих тегов, чтобы
+        показать, сколько рецептов добавит выбор еще одного тега. Счетчики
+        времени приготовления учитывают все фильтры. Каждый набор
+        счетчиков считается одним группирующим запросом.
+        """
+        without_tags = request.query_params.copy()
+        without_tags.pop('tags', None)
+        tag_counts = dict(
+            RecipeFilter(without_tags, Recipe.objects.all(), request=request)
+            .qs.order_by().values_list('tags')
+            .annotate(count=Count('id', distinct=True))
+        )
+        recipes = RecipeFilter(
+            request.query_params, Recipe.objects.all(), request=request
+        ).qs.order_by()
+        bucket_counts = recipes.aggregate(**{
+            f'{low}-{high}': Count(
+                'id', distinct=True, filter=Q(cooking_time__range=(low, high))
+            )
+            for low, high in COOKING_TIME_BUCKETS
+        })
+        return Response({
+            'tags': [
+                {**tag, 'count': tag_counts.get(tag['id'], 0)}
+                for tag in TagSerializer(Tag.objects.all(), many=True).data
+            ],
+            'cooking_time': [
+                {
+                    'min': low,
+                    'max': high,
+                    'count': bucket_counts[f'{low}-{high}'],
+                }
+                for low, high in COOKING_TIME_BUCKETS
+            ],
+        }, status=HTTP_200_OK)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь.
+
+        Записи ленты читаются проходом по индексу таблицы ленты
+        и сливаются с рецептами авторов без рассылки (см. recipes.feed)
+        с курсорной пагинацией, рецепты страницы - одним запросом
+        по первичному ключу.
+        """
+        entries = self.paginate_queryset(get_timeline(request.user))
+        recipes = Recipe.objects.with_related(request.user).in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = RecipeGetSerializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def bulk_change(self, request, model):
+        """Пакетное добавление и удаление рецептов по спискам id."""
+        serializer = BulkChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response(change_user_recipes(
+            model, request.user, data['add'], data['remove']
+        ), status=HTTP_200_OK)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite',
+        url_name='bulk-favorite'
+    )
+    def bulk_favorite(self, request):
+        """Пакетное изменение избранного пользователя."""
+        return self.bulk_change(request, FavoriteRecipe)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart',
+        url_name='bulk-shopping-cart'
+    )
+    def bulk_shopping_cart(self, request):
+        """Пакетное изменение списка покупок пользователя."""
+        return self.bulk_change(request, ShoppingCart)
+
     @action(detail=True, permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk):
         """Добавление/удаление рецепта из избранного."""
@@ -255,11 +498,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
             }
         )
         serializer.is_valid(raise_exception=True)
-        get_object_or_404(
-            FavoriteRecipe,
-            user=self.request.user,
-            recipe=get_object_or_404(Recipe, pk=pk)
-        ).delete()
+        with transaction.atomic():
+            lock_user(request.user.pk)
+            get_object_or_404(
+                FavoriteRecipe,
+                user=self.request.user,
+                recipe=get_object_or_404(Recipe, pk=pk)
+            ).delete()
         return Response(status=HTTP_204_NO_CONTENT)
 
     @action(detail=True, permission_classes=(AllowAny,), url_path='get-link')
@@ -306,48 +551,83 @@ class RecipeViewSet(viewsets.ModelViewSet):
             }
         )
         serializer.is_valid(raise_exception=True)
-        get_object_or_404(
-            ShoppingCart,
-            user=self.request.user,
-            recipe=get_object_or_404(Recipe, pk=pk)
-        ).delete()
+        with transaction.atomic():
+            lock_user(request.user.pk)
+            get_object_or_404(
+                ShoppingCart,
+                user=self.request.user,
+                recipe=get_object_or_404(Recipe, pk=pk)
+            ).delete()
         return Response(status=HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingListTextRenderer, ShoppingListCSVRenderer,
+                          ShoppingListJSONRenderer),
         url_path='download_shopping_cart'
     )
     def download_shopping_cart(self, request):
-        """Скачивает список покупок пользователя в txt-файл."""
-        shopping_cart = ShoppingCart.objects.filter(user=request.user)
-
-        if not shopping_cart.exists():
+        """Скачивает список покупок пользователя.
+
+        Суммы ингредиентов читаются из таблицы списков покупок,
+        которая обновляется при изменении корзины и рецептов. Файл
+        в формате txt, csv или json (параметр format) отдается потоком
+        по мере чтения строк.
+        """
+        rows = get_rows(request.user)
+        first = next(rows, None)
+        if first is None:
             return Response({'detail': 'Список покупок пуст'}, status=404)
 
-        ingredients = {}
-
-        for item in shopping_cart:
-            recipe = item.recipe
-            for recipe_ingredient in RecipeIngredient.objects.filter(
-                recipe=recipe
-            ):
-                ingredient = recipe_ingredient.ingredient
-                name = ingredient.name
-                unit = ingredient.measurement_unit
-                amount = recipe_ingredient.amount
-                if name in ingredients:
-                    ingredients[name]['amount'] += amount
-                else:
-                    ingredients[name] = {'amount': amount, 'unit': unit}
-
-        content = 'Список покупок:\n'
-        for name, data in ingredients.items():
-            content += f"{name} — {data['amount']} {data['unit']}\n"
-
-        response = HttpResponse(content, content_type='text/plain')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(chain((first,), rows)),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.txt"'
+            f'attachment; filename="{renderer.get_filename()}"'
         )
         return response
+
+
+class JobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+                 mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Фоновые задачи текущего пользователя.
+
+    POST ставит задачу в очередь и сразу отвечает 202, состояние
+    задачи проверяется GET-запросом, готовый результат скачивается
+    по адресу download_url. Задачи выполняет команда run_jobs.
+    """
+
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = ApiPagination
+
+    def get_queryset(self):
+        """Возвращает задачи текущего пользователя."""
+        return Job.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        """Ставит задачу в очередь."""
+        response = super().create(request, *args, **kwargs)
+        response.status_code = HTTP_202_ACCEPTED
+        response['Location'] = reverse(
+            'jobs-detail', args=(response.data['id'],), request=request
+        )
+        return response
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        """Отдает файл результата выполненной задачи."""
+        job = self.get_object()
+        if job.status != Job.DONE or not job.result:
+            return Response(
+                {'detail': 'Результат задачи еще не готов.'},
+                status=HTTP_409_CONFLICT
+            )
+        return FileResponse(
+            job.result.open('rb'), as_attachment=True,
+            filename=os.path.basename(job.result.name)
+        )
@@ -82,6 +82,19 @@ DATABASES = {
 
 AUTH_USER_MODEL = 'users.User'
 
+# Кэш хранит версии справочников и карточек, поэтому он должен быть
+# общим для всех процессов: gunicorn, run_jobs и команд manage.py.
+# По умолчанию используется таблица в базе (python manage.py
+# createcachetable), в Docker - Redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram_cache'),
+    }
+}
+
 # Для локального развертывания:
 """
 DATABASES = {
@@ -124,6 +137,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Медиафайлы именуются по содержимому и хранятся без повторов,
+# см. recipes.storage.
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+CATALOG_SNAPSHOT_URL = '/catalog/'
+CATALOG_SNAPSHOT_ROOT = os.getenv(
+    'CATALOG_SNAPSHOT_ROOT', os.path.join(BASE_DIR, 'catalog_snapshots')
+)
+
+# Загруженные изображения ждут обработки в пуле процессов в этом каталоге.
+# При IMAGE_WORKERS=0 они обрабатываются сразу после фиксации транзакции.
+IMAGE_STAGING_ROOT = os.getenv(
+    'IMAGE_STAGING_ROOT', os.path.join(BASE_DIR, 'image_staging')
+)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+# Результаты фоновых задач (см. recipes.jobs) отдаются только через API.
+JOB_RESULT_ROOT = os.getenv(
+    'JOB_RESULT_ROOT', os.path.join(BASE_DIR, 'job_results')
+)
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
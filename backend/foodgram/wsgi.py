@@ -7,3 +7,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Индекс ингредиентов строится при запуске процесса, а не при первом
+# запросе автодополнения.
+from recipes.prefix_index import ingredient_index  # noqa: E402
+
+ingredient_index.warm()
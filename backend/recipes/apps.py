@@ -1,5 +1,6 @@
 """Модуль инициирования приложения Recipes."""
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecipesConfig(AppConfig):
@@ -7,3 +8,15 @@ class RecipesConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        """Подключает обработчики сигналов."""
+        from recipes import signals  # noqa: F401
+        post_migrate.connect(restore_search_triggers, sender=self)
+
+
+def restore_search_triggers(using, **kwargs):
+    """Восстанавливает триггеры поискового индекса после миграций."""
+    from django.db import connections
+    from recipes.search import restore_sqlite_triggers
+    restore_sqlite_triggers(connections[using])
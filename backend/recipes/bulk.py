@@ -0,0 +1,123 @@
+"""Модуль пакетного изменения избранного, корзины и подписок.
+
+Добавления и удаления применяются в одной транзакции: новые записи
+создаются одним bulk_create, удаляемые удаляются одним запросом
+по набору id. bulk_create не отправляет сигналы, поэтому наборы
+в кэше, списки покупок и ленты обновляются здесь явно. Удаление
+обрабатывают сигналы, которые для удаления набором считают разности
+один раз (см. recipes.signals.deleted_together).
+
+Изменения одного пользователя выполняются по очереди под блокировкой
+его строки (см. lock_user), поэтому прочитанные до вставки записи
+совпадают с базой и разности применяются только для вставленных строк.
+
+Результат возвращается для каждого переданного id.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from recipes.cache import invalidate_user_recipes
+from recipes.feed import subscribe
+from recipes.models import ShoppingCart, Subscription
+from recipes.shopping_list import add_recipes
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+
+User = get_user_model()
+
+
+def lock_user(user_id):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Вызывается внутри transaction.atomic() перед изменением избранного,
+    корзины или подписок пользователя.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user_id
+    ).values_list('pk', flat=True))
+
+
+def get_add_status(pk, found, current, forbidden=()):
+    """Возвращает результат добавления записи с id pk."""
+    if pk not in found:
+        return NOT_FOUND
+    if pk in forbidden:
+        return FORBIDDEN
+    if pk in current:
+        return EXISTS
+    return ADDED
+
+
+def get_remove_status(pk, found, current):
+    """Возвращает результат удаления записи с id pk."""
+    if pk not in found:
+        return NOT_FOUND
+    if pk in current:
+        return REMOVED
+    return MISSING
+
+
+def change_related(model, user, field, add_ids, remove_ids, forbidden=()):
+    """Добавляет и удаляет записи модели для пользователя.
+
+    field - имя внешнего ключа на рецепт или автора. Возвращает
+    результаты добавления и удаления и список добавленных id.
+    """
+    lock_user(user.pk)
+    queryset = model.objects.filter(user=user)
+    requested = set(add_ids) | set(remove_ids)
+    related_model = model._meta.get_field(field).related_model
+    found = set(related_model.objects.filter(
+        pk__in=requested
+    ).values_list('pk', flat=True))
+    current = set(queryset.filter(
+        **{f'{field}_id__in': requested}
+    ).values_list(f'{field}_id', flat=True))
+    added = [
+        pk for pk in add_ids
+        if get_add_status(pk, found, current, forbidden) == ADDED
+    ]
+    removed = [pk for pk in remove_ids if pk in current]
+    model.objects.bulk_create(
+        [model(user=user, **{f'{field}_id': pk}) for pk in added],
+        ignore_conflicts=True,
+    )
+    if removed:
+        queryset.filter(**{f'{field}_id__in': removed}).delete()
+    return (
+        [{'id': pk, 'status': get_add_status(pk, found, current, forbidden)}
+         for pk in add_ids],
+        [{'id': pk, 'status': get_remove_status(pk, found, current)}
+         for pk in remove_ids],
+        added,
+    )
+
+
+def change_user_recipes(model, user, add_ids, remove_ids):
+    """Пакетно меняет избранное или корзину пользователя."""
+    with transaction.atomic():
+        added_results, removed_results, added = change_related(
+            model, user, 'recipe', add_ids, remove_ids
+        )
+        if model is ShoppingCart and added:
+            add_recipes(user.pk, added)
+        if added:
+            invalidate_user_recipes(model, user.pk)
+    return {'add': added_results, 'remove': removed_results}
+
+
+def change_subscriptions(user, add_ids, remove_ids):
+    """Пакетно меняет подписки пользователя на авторов."""
+    with transaction.atomic():
+        added_results, removed_results, added = change_related(
+            Subscription, user, 'author',
+            add_ids, remove_ids, forbidden={user.pk},
+        )
+        if added:
+            subscribe(user.pk, added)
+    return {'add': added_results, 'remove': removed_results}
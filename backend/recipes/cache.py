@@ -0,0 +1,125 @@
+"""Модуль кэша рецептов.
+
+Карточка - не зависящая от пользователя часть ответа с рецептом:
+автор, теги, ингредиенты, изображение, описание и время приготовления.
+Ключ карточки состоит из номера формата, общей версии и идентификатора
+рецепта. Номер формата RECIPE_CARD_FORMAT увеличивается при изменении
+состава карточки, чтобы не читать карточки прежнего вида.
+
+Наборы рецептов пользователя в избранном и в корзине хранятся
+отсортированными массивами id вместе с меткой версии, которая меняется
+при каждом изменении набора: измененный набор удаляется из кэша
+и загружается заново.
+"""
+
+import time
+from array import array
+from bisect import bisect_left
+
+from api.constants import RECIPE_CARD_TIMEOUT, USER_RECIPES_TIMEOUT
+from django.core.cache import cache
+from django.db import transaction
+
+RECIPE_CARD_VERSION_KEY = 'recipe_card:version'
+RECIPE_CARD_FORMAT = 2
+
+
+def get_recipe_card_version():
+    """Возвращает текущую общую версию карточек.
+
+    При потере ключа версия создается заново из текущего времени,
+    чтобы не совпасть ни с одной из прежних версий.
+    """
+    return cache.get_or_set(RECIPE_CARD_VERSION_KEY, time.time_ns, None)
+
+
+def recipe_card_key(pk, version):
+    """Возвращает ключ кэша карточки рецепта."""
+    return f'recipe_card:{RECIPE_CARD_FORMAT}:{version}:{pk}'
+
+
+def get_recipe_cards(pks, version):
+    """Возвращает закэшированные карточки в виде словаря {pk: карточка}."""
+    keys = {recipe_card_key(pk, version): pk for pk in pks}
+    return {
+        keys[key]: card for key, card in cache.get_many(keys).items()
+    }
+
+
+def set_recipe_cards(cards, version):
+    """Сохраняет карточки, переданные словарем {pk: карточка}."""
+    cache.set_many(
+        {recipe_card_key(pk, version): card for pk, card in cards.items()},
+        RECIPE_CARD_TIMEOUT
+    )
+
+
+def invalidate_recipe_cards(pks):
+    """Удаляет карточки указанных рецептов."""
+    version = get_recipe_card_version()
+    cache.delete_many([recipe_card_key(pk, version) for pk in pks])
+
+
+def invalidate_all_recipe_cards():
+    """Делает недействительными все карточки сменой общей версии."""
+    try:
+        cache.incr(RECIPE_CARD_VERSION_KEY)
+    except ValueError:
+        get_recipe_card_version()
+
+
+def user_recipes_key(model, user_id):
+    """Возвращает ключ кэша рецептов пользователя в избранном или корзине."""
+    return f'user_recipes:{model._meta.model_name}:{user_id}'
+
+
+def get_user_recipes(model, user_id):
+    """Возвращает версию и отсортированный массив id рецептов пользователя.
+
+    Массив загружается из базы данных одним запросом и хранится в кэше
+    до изменения набора, см. invalidate_user_recipes.
+    """
+    key = user_recipes_key(model, user_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = (time.time_ns(), array('q', sorted(
+            model.objects.filter(user_id=user_id).values_list(
+                'recipe_id', flat=True
+            )
+        )))
+        cache.set(key, entry, USER_RECIPES_TIMEOUT)
+    return entry
+
+
+def has_user_recipe(recipe_ids, recipe_id):
+    """Проверяет наличие id рецепта в отсортированном массиве."""
+    index = bisect_left(recipe_ids, recipe_id)
+    return index < len(recipe_ids) and recipe_ids[index] == recipe_id
+
+
+def invalidate_user_recipes(model, user_id):
+    """Удаляет закэшированный набор рецептов пользователя.
+
+    Набор не дополняется на месте: чтение и запись ключа из разных
+    процессов могли бы потерять изменение. Ключ удаляется сразу и еще
+    раз после фиксации транзакции, чтобы в кэш не попал набор,
+    прочитанный до нее; следующий запрос загрузит набор из базы.
+    """
+    key = user_recipes_key(model, user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key), robust=True)
+
+
+def catalog_version_key(model):
+    """Возвращает ключ кэша версии справочника."""
+    return f'catalog_version:{model._meta.model_name}'
+
+
+def get_catalog_version(model):
+    """Возвращает метку версии справочника (время в наносекундах)."""
+    return cache.get_or_set(catalog_version_key(model), time.time_ns, None)
+
+
+def bump_catalog_version(model):
+    """Обновляет метку версии справочника после его изменения."""
+    cache.set(catalog_version_key(model), time.time_ns(), None)
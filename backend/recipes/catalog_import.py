@@ -0,0 +1,238 @@
+"""Модуль массового импорта справочников тегов и ингредиентов.
+
+Файл CSV или JSON читается потоком и загружается пачками по
+CATALOG_IMPORT_BATCH_SIZE записей. Записи сопоставляются с базой
+по названию: для пачки выполняется один запрос существующих записей
+и один INSERT ... ON CONFLICT (name) DO UPDATE для новых и
+изменившихся записей, совпадающие записи не перезаписываются.
+
+Массовая вставка не вызывает сигналы сохранения, поэтому карточки
+рецептов, версия справочника и его снимок обновляются один раз
+после загрузки.
+"""
+
+import json
+import os
+from csv import reader
+from itertools import islice
+
+from api.constants import CATALOG_IMPORT_BATCH_SIZE, CATALOG_IMPORT_READ_SIZE
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from recipes.cache import bump_catalog_version, invalidate_all_recipe_cards
+from recipes.models import Ingredient, Tag
+from recipes.prefix_index import ingredient_index
+from recipes.snapshots import schedule_catalog_export
+
+CATALOG_FIELDS = {
+    Ingredient: ('name', 'measurement_unit'),
+    Tag: ('name', 'slug'),
+}
+CATALOG_UNIQUE_FIELDS = {
+    Ingredient: (),
+    Tag: ('slug',),
+}
+
+
+def read_csv(file):
+    """Читает строки CSV-файла."""
+    yield from reader(file)
+
+
+def read_json(file, size=CATALOG_IMPORT_READ_SIZE):
+    """Читает объекты из JSON-массива, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Файл JSON должен содержать массив.')
+    position = 1
+    while True:
+        while True:
+            buffer = buffer[position:].lstrip()
+            if buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            position = 0
+            if buffer:
+                break
+            chunk = file.read(size)
+            if not chunk:
+                raise ValueError('Массив JSON не закрыт.')
+            buffer += chunk
+        if buffer.startswith(']'):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+
+
+def read_rows(path, fields):
+    """Возвращает записи файла в виде словарей {поле: значение}.
+
+    Строка CSV содержит значения полей по порядку, объект JSON -
+    значения по именам полей.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.csv', '.json'):
+        raise ValueError(f'Неподдерживаемый формат файла: {extension}.')
+    with open(path, encoding='utf-8') as file:
+        if extension == '.csv':
+            for line, row in enumerate(read_csv(file), 1):
+                if not row:
+                    continue
+                if len(row) < len(fields):
+                    raise ValueError(f'Строка {line}: не хватает значений.')
+                yield dict(zip(fields, (value.strip() for value in row)))
+            return
+        for number, item in enumerate(read_json(file), 1):
+            if not isinstance(item, dict) or set(fields) - set(item):
+                raise ValueError(
+                    f'Запись {number}: нужны поля {", ".join(fields)}.'
+                )
+            yield {field: str(item[field]).strip() for field in fields}
+
+
+def check_unique(model, rows, owners):
+    """Проверяет, что уникальные поля записей не заняты другими записями.
+
+    Значения сравниваются с базой и с уже прочитанными записями файла,
+    owners - словарь {(поле, значение): название записи} для файла.
+    Занятое значение - ошибка записи, а не нарушение ограничения базы
+    посреди загрузки.
+    """
+    key = CATALOG_FIELDS[model][0]
+    for field in CATALOG_UNIQUE_FIELDS[model]:
+        stored = dict(model.objects.filter(**{
+            f'{field}__in': [row[field] for row in rows.values()]
+        }).values_list(field, key))
+        for name, row in rows.items():
+            value = row[field]
+            owner = owners.setdefault(
+                (field, value), stored.get(value, name)
+            )
+            if owner != name:
+                raise ValueError(
+                    f'{name}: значение {field} "{value}" уже занято '
+                    f'записью {owner}.'
+                )
+
+
+def import_batch(model, batch, counts, dry_run, report, owners):
+    """Загружает пачку записей и прибавляет их число к counts."""
+    key, *fields = CATALOG_FIELDS[model]
+    rows = {row[key]: row for row in batch if row[key]}
+    check_unique(model, rows, owners)
+    existing = model.objects.in_bulk(rows, field_name=key)
+    changed = []
+    for name, row in rows.items():
+        current = existing.get(name)
+        if current is None:
+            counts['inserted'] += 1
+            report('+', row, None)
+            changed.append(model(**row))
+        elif any(getattr(current, field) != row[field] for field in fields):
+            counts['updated'] += 1
+            report('~', row, current)
+            for field in fields:
+                setattr(current, field, row[field])
+            changed.append(current)
+        else:
+            counts['unchanged'] += 1
+    if model is Tag:
+        new = [tag for tag in changed if tag.bit is None]
+        for tag, bit in zip(new, Tag.get_free_bits(len(new))):
+            tag.bit = bit
+    if changed and not dry_run:
+        model.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=(key,),
+            update_fields=fields,
+        )
+
+
+def import_catalog(model, rows, dry_run=False, report=None,
+                   batch_size=CATALOG_IMPORT_BATCH_SIZE):
+    """Загружает записи справочника и возвращает число записей.
+
+    Возвращает словарь с числом добавленных (inserted), измененных
+    (updated) и совпавших (unchanged) записей. Функция report(знак,
+    запись, текущий объект) вызывается для каждой добавляемой (+)
+    и изменяемой (~) записи. С dry_run база не изменяется.
+    """
+    report = report or (lambda *args: None)
+    counts = dict.fromkeys(('inserted', 'updated', 'unchanged'), 0)
+    rows = iter(rows)
+    owners = {}
+    with transaction.atomic():
+        while batch := list(islice(rows, batch_size)):
+            import_batch(model, batch, counts, dry_run, report, owners)
+        if not dry_run and (counts['inserted'] or counts['updated']):
+            invalidate_all_recipe_cards()
+            bump_catalog_version(model)
+            schedule_catalog_export(model)
+            if model is Ingredient:
+                transaction.on_commit(ingredient_index.expire)
+    return counts
+
+
+class ImportCatalogCommand(BaseCommand):
+    """Базовая команда загрузки справочника из CSV или JSON файла."""
+
+    model = None
+    default_file = None
+
+    def add_arguments(self, parser):
+        """Добавляет параметры команды."""
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, '..', 'data',
+                                 self.default_file),
+            help='CSV или JSON файл (по умолчанию data/'
+                 f'{self.default_file}).'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать изменения, не изменяя базу.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=CATALOG_IMPORT_BATCH_SIZE,
+            help='Число записей в одном запросе.'
+        )
+
+    def report(self, sign, row, current):
+        """Выводит добавляемую или изменяемую запись."""
+        key, *fields = CATALOG_FIELDS[self.model]
+        values = ', '.join(row[field] for field in fields)
+        if current is not None:
+            previous = ', '.join(getattr(current, field) for field in fields)
+            values = f'{previous} -> {values}'
+        self.stdout.write(f'{sign} {row[key]}: {values}')
+
+    def handle(self, *args, **options):
+        """Загружает справочник и выводит число записей."""
+        try:
+            counts = import_catalog(
+                self.model,
+                read_rows(options['path'], CATALOG_FIELDS[self.model]),
+                dry_run=options['dry_run'],
+                report=self.report if options['dry_run'] else None,
+                batch_size=options['batch_size'],
+            )
+        except (OSError, ValueError, ValidationError,
+                IntegrityError) as error:
+            raise CommandError(error)
+        message = (
+            f'{self.model._meta.verbose_name_plural}: '
+            f'добавлено {counts["inserted"]}, '
+            f'изменено {counts["updated"]}, '
+            f'без изменений {counts["unchanged"]}.'
+        )
+        if options['dry_run']:
+            message += ' Пробный запуск, база не изменена.'
+        self.stdout.write(self.style.SUCCESS(message))
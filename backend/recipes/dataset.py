@@ -0,0 +1,421 @@
+"""Модуль генерации синтетических данных для нагрузочной проверки.
+
+Генератор создает пользователей, рецепты с тегами и ингредиентами,
+избранное, корзины и подписки массовыми вставками. Данные
+воспроизводимы: каждая пачка строк генерируется отдельным генератором
+случайных чисел, зерно которого зависит только от общего зерна,
+этапа и номера пачки, а id пользователей и рецептов назначаются
+явно. Поэтому набор данных не зависит от числа процессов, между
+которыми распределяются пачки.
+
+Распределения приближены к реальным: число рецептов у автора,
+популярность авторов у подписчиков, тегов, ингредиентов и рецептов
+подчиняются закону Ципфа, так что у немногих авторов больше
+FEED_FANOUT_MAX_FOLLOWERS подписчиков и их лента собирается при
+чтении. Число рецептов в избранном, корзине и подписок у пользователя
+распределено экспоненциально.
+
+Массовая вставка не вызывает сигналы сохранения, поэтому маска тегов
+рецептов заполняется сразу, а число подписчиков, ленты, списки
+покупок и ссылки на медиафайлы пересчитываются после вставки.
+"""
+
+import io
+import random
+from datetime import timedelta
+from itertools import accumulate, chain
+
+import django
+from api.constants import (DATASET_BATCH_SIZE, DATASET_PUBLISH_PERIOD,
+                           FEED_BACKFILL_SIZE, FEED_FANOUT_MAX_FOLLOWERS,
+                           MAX_COOKING_TIME, MIN_COOKING_TIME)
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from PIL import Image
+from recipes.feed import add_entries
+from recipes.images import render_file, set_renditions
+from recipes.media import change_references, get_media_names
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingCart,
+                            Subscription, Tag, TimelineEntry)
+from recipes.shopping_list import rebuild
+
+User = get_user_model()
+
+FIRST_NAMES = (
+    'Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Ирина', 'Дарья',
+    'Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Иван', 'Максим',
+)
+LAST_NAMES = (
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров',
+    'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков',
+)
+DISH_ADJECTIVES = (
+    'Домашний', 'Быстрый', 'Летний', 'Сытный', 'Легкий', 'Пряный',
+    'Бабушкин', 'Праздничный', 'Постный', 'Острый', 'Нежный', 'Запеченный',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'плов', 'омлет', 'рагу', 'борщ', 'гуляш',
+    'паштет', 'десерт', 'соус', 'ризотто', 'кекс', 'смузи', 'шашлык',
+)
+STEPS = (
+    'Нарежьте овощи небольшими кубиками.',
+    'Разогрейте сковороду с маслом.',
+    'Обжарьте до золотистой корочки.',
+    'Добавьте специи и перемешайте.',
+    'Тушите под крышкой на медленном огне.',
+    'Запекайте в разогретой духовке.',
+    'Взбейте яйца с молоком до однородности.',
+    'Посолите и поперчите по вкусу.',
+    'Дайте блюду настояться перед подачей.',
+    'Украсьте зеленью и подавайте.',
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+AMOUNT_WEIGHTS = (8, 8, 6, 5, 6, 5, 6, 10, 6, 8, 5, 5, 4, 2)
+TAG_COUNTS = (1, 2, 3)
+TAG_COUNT_WEIGHTS = (50, 35, 15)
+IMAGE_COLORS = (
+    '#c0392b', '#d35400', '#f39c12', '#27ae60', '#16a085', '#2980b9',
+    '#8e44ad', '#7f8c8d',
+)
+
+# Показатели степени закона Ципфа: чем больше, тем сильнее перекос.
+AUTHOR_SKEW = 0.8
+FOLLOWING_SKEW = 0.9
+RECIPE_SKEW = 0.9
+TAG_SKEW = 1.0
+INGREDIENT_SKEW = 1.0
+
+STAGES = ('users', 'recipes', 'relations', 'feeds')
+
+context = {}
+
+
+def get_cum_weights(size, skew):
+    """Возвращает накопленные веса закона Ципфа для size элементов."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+def pick(rng, cum_weights, count=1):
+    """Выбирает count номеров элементов по накопленным весам."""
+    return rng.choices(range(len(cum_weights)), cum_weights=cum_weights,
+                       k=count)
+
+
+def pick_unique(rng, cum_weights, count):
+    """Выбирает до count разных номеров элементов по накопленным весам.
+
+    Популярные элементы выпадают повторно, поэтому число попыток
+    ограничено, и при сильном перекосе номеров может быть меньше count.
+    """
+    count = min(count, len(cum_weights))
+    chosen = set()
+    for _ in range(count * 4):
+        if len(chosen) >= count:
+            break
+        chosen.update(pick(rng, cum_weights, count - len(chosen)))
+    return sorted(chosen)[:count]
+
+
+def get_count(rng, mean):
+    """Возвращает случайное число с экспоненциальным распределением."""
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def make_image(color):
+    """Возвращает JPEG-заглушку фото рецепта."""
+    output = io.BytesIO()
+    Image.new('RGB', (1280, 960), color).save(output, 'JPEG', quality=85)
+    return output.getvalue()
+
+
+def create_images():
+    """Сохраняет заглушки фото рецептов вместе с уменьшенными копиями.
+
+    Возвращает список пар (имя файла, копии) для поля image и
+    image_renditions рецептов.
+    """
+    images = []
+    for color in IMAGE_COLORS:
+        content = make_image(color)
+        recipe = Recipe()
+        recipe.image.save(f'{color[1:]}.jpg', ContentFile(content),
+                          save=False)
+        set_renditions(recipe, 'image', render_file(content))
+        images.append((recipe.image.name, recipe.image_renditions))
+    return images
+
+
+def get_next_id(model):
+    """Возвращает id, с которого можно назначать id новым объектам."""
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def get_plan(users, recipes, favorites, carts, subscriptions, seed,
+             password, batch_size=DATASET_BATCH_SIZE):
+    """Возвращает описание набора данных для генерации по пачкам."""
+    tags = list(Tag.objects.order_by('pk').values_list('pk', 'bit'))
+    ingredients = list(
+        Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+    )
+    if not tags or not ingredients:
+        raise ValueError(
+            'Сначала загрузите теги и ингредиенты '
+            '(import_tags, import_ingredients).'
+        )
+    return {
+        'users': users,
+        'recipes': recipes,
+        'favorites': favorites,
+        'carts': carts,
+        'subscriptions': subscriptions,
+        'seed': seed,
+        'password': password,
+        'batch_size': batch_size,
+        'user_base': get_next_id(User),
+        'recipe_base': get_next_id(Recipe),
+        'published_until': timezone.now(),
+        'tags': tags,
+        'ingredients': ingredients,
+        'images': create_images(),
+    }
+
+
+def get_tasks(plan, stage):
+    """Возвращает пачки этапа в виде (этап, номер пачки, начало, конец)."""
+    size = plan['recipes'] if stage == 'recipes' else plan['users']
+    return [
+        (stage, number, start, min(start + plan['batch_size'], size))
+        for number, start in enumerate(range(0, size, plan['batch_size']))
+    ]
+
+
+def get_celebrities(plan):
+    """Возвращает номера пользователей по убыванию популярности.
+
+    Порядок перемешан, чтобы популярность автора у подписчиков не
+    совпадала с числом его рецептов: иначе ленты подписчиков самых
+    плодовитых авторов разрастаются до FEED_BACKFILL_SIZE записей
+    на каждую подписку.
+    """
+    users = list(range(plan['users']))
+    random.Random(f'{plan["seed"]}:celebrities').shuffle(users)
+    return users
+
+
+def init_worker(plan):
+    """Готовит процесс к генерации пачек набора данных."""
+    if not apps.ready:
+        django.setup()
+    context.clear()
+    context.update(
+        plan=plan,
+        authors=get_cum_weights(plan['users'], AUTHOR_SKEW),
+        following=get_cum_weights(plan['users'], FOLLOWING_SKEW),
+        celebrities=get_celebrities(plan),
+        popular=get_cum_weights(plan['recipes'], RECIPE_SKEW),
+        tags=get_cum_weights(len(plan['tags']), TAG_SKEW),
+        ingredients=get_cum_weights(
+            len(plan['ingredients']), INGREDIENT_SKEW
+        ),
+    )
+
+
+def make_users(rng, plan, start, stop):
+    """Создает пользователей с номерами от start до stop."""
+    users = []
+    for number in range(start, stop):
+        pk = plan['user_base'] + number
+        users.append(User(
+            pk=pk, username=f'user{pk}', email=f'user{pk}@example.com',
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=plan['password'],
+        ))
+    User.objects.bulk_create(users)
+
+
+def get_pub_date(rng, plan, number):
+    """Возвращает дату публикации рецепта с номером number.
+
+    Рецепты распределены по DATASET_PUBLISH_PERIOD до создания плана
+    в порядке номеров, со случайным сдвигом внутри своего интервала.
+    """
+    step = DATASET_PUBLISH_PERIOD / max(plan['recipes'], 1)
+    return plan['published_until'] - timedelta(
+        seconds=(plan['recipes'] - number - rng.random()) * step
+    )
+
+
+def make_recipes(rng, plan, start, stop):
+    """Создает рецепты с номерами от start до stop и их связи."""
+    recipes, recipe_tags, recipe_ingredients = [], [], []
+    for number in range(start, stop):
+        pk = plan['recipe_base'] + number
+        tags = [plan['tags'][index] for index in pick_unique(
+            rng, context['tags'],
+            rng.choices(TAG_COUNTS, TAG_COUNT_WEIGHTS)[0],
+        )]
+        image, renditions = rng.choice(plan['images'])
+        recipes.append(Recipe(
+            pk=pk,
+            author_id=plan['user_base'] + pick(rng, context['authors'])[0],
+            name=f'{rng.choice(DISH_ADJECTIVES)} {rng.choice(DISHES)}',
+            text=' '.join(rng.sample(STEPS, rng.randint(2, 6))),
+            cooking_time=min(max(
+                int(rng.lognormvariate(3.5, 0.7)), MIN_COOKING_TIME
+            ), MAX_COOKING_TIME),
+            image=image,
+            image_renditions=renditions,
+            tags_mask=sum(1 << bit for _, bit in tags),
+        ))
+        recipe_tags.extend((pk, tag_id) for tag_id, _ in tags)
+        for index in pick_unique(rng, context['ingredients'],
+                                 int(rng.triangular(3, 15, 7))):
+            recipe_ingredients.append(RecipeIngredient(
+                recipe_id=pk, ingredient_id=plan['ingredients'][index],
+                amount=rng.choices(AMOUNTS, AMOUNT_WEIGHTS)[0],
+            ))
+    Recipe.objects.bulk_create(recipes)
+    # bulk_create проставляет pub_date (auto_now_add) текущим временем,
+    # поэтому даты публикации записываются отдельным запросом.
+    for number, recipe in enumerate(recipes, start):
+        recipe.pub_date = get_pub_date(rng, plan, number)
+    Recipe.objects.bulk_update(recipes, ('pub_date',))
+    for model in (RecipeTag, Recipe.tags.through):
+        model.objects.bulk_create([
+            model(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id, tag_id in recipe_tags
+        ])
+    RecipeIngredient.objects.bulk_create(recipe_ingredients)
+
+
+def make_relations(rng, plan, start, stop):
+    """Создает избранное, корзины и подписки пользователей пачки."""
+    favorites, carts, subscriptions = [], [], []
+    for number in range(start, stop):
+        user_id = plan['user_base'] + number
+        for model, mean, rows in (
+            (FavoriteRecipe, plan['favorites'], favorites),
+            (ShoppingCart, plan['carts'], carts),
+        ):
+            rows.extend(
+                model(user_id=user_id, recipe_id=plan['recipe_base'] + index)
+                for index in pick_unique(
+                    rng, context['popular'], get_count(rng, mean)
+                )
+            )
+        authors = (context['celebrities'][index] for index in pick_unique(
+            rng, context['following'], get_count(rng, plan['subscriptions'])
+        ))
+        subscriptions.extend(
+            Subscription(user_id=user_id, author_id=plan['user_base'] + author)
+            for author in authors if author != number
+        )
+    for model, rows in ((FavoriteRecipe, favorites), (ShoppingCart, carts),
+                        (Subscription, subscriptions)):
+        model.objects.bulk_create(rows)
+
+
+def make_feeds(rng, plan, start, stop):
+    """Наполняет ленты и пересчитывает списки покупок пользователей.
+
+    Лента наполняется так же, как при подписке (см. recipes.feed):
+    последними FEED_BACKFILL_SIZE рецептами авторов, рецепты которых
+    рассылаются при публикации.
+    """
+    user_ids = range(plan['user_base'] + start, plan['user_base'] + stop)
+    following = list(Subscription.objects.filter(
+        user_id__in=user_ids,
+        author__followers_count__lte=FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('user_id', 'author_id'))
+    latest = {}
+    for recipe_id, author_id, pub_date in Recipe.objects.filter(
+        author_id__in={author_id for _, author_id in following}
+    ).latest_per_author(FEED_BACKFILL_SIZE).values_list(
+        'id', 'author_id', 'pub_date'
+    ):
+        latest.setdefault(author_id, []).append((recipe_id, pub_date))
+    add_entries(list(chain.from_iterable(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in latest.get(author_id, ())
+        )
+        for user_id, author_id in following
+    )))
+    rebuild(list(user_ids))
+
+
+STAGE_HANDLERS = {
+    'users': make_users,
+    'recipes': make_recipes,
+    'relations': make_relations,
+    'feeds': make_feeds,
+}
+
+
+def run_task(task):
+    """Генерирует пачку строк этапа и возвращает ее размер."""
+    stage, number, start, stop = task
+    plan = context['plan']
+    rng = random.Random(f'{plan["seed"]}:{stage}:{number}')
+    with transaction.atomic():
+        STAGE_HANDLERS[stage](rng, plan, start, stop)
+    return stop - start
+
+
+def reset_sequence(model):
+    """Сдвигает последовательность id после вставки с явными id."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def count_followers(plan):
+    """Пересчитывает число подписчиков созданных пользователей."""
+    User.objects.filter(
+        pk__gte=plan['user_base'],
+        pk__lt=plan['user_base'] + plan['users'],
+    ).update(followers_count=Coalesce(Subquery(
+        Subscription.objects.filter(author=OuterRef('pk')).values(
+            'author'
+        ).annotate(count=Count('pk')).values('count')
+    ), 0))
+
+
+def count_media(plan):
+    """Добавляет ссылки созданных рецептов на заглушки фото."""
+    recipes = Recipe.objects.filter(
+        pk__gte=plan['recipe_base'],
+        pk__lt=plan['recipe_base'] + plan['recipes'],
+    )
+    renditions = dict(plan['images'])
+    deltas = {}
+    for image, count in recipes.values_list('image').annotate(
+        count=Count('pk')
+    ).order_by():
+        recipe = Recipe(image=image, image_renditions=renditions[image])
+        for name, references in get_media_names(recipe).items():
+            deltas[name] = deltas.get(name, 0) + references * count
+    change_references(deltas)
+
+
+def finish_stage(plan, stage):
+    """Пересчитывает данные, которые зависят от всего этапа."""
+    if stage == 'users':
+        reset_sequence(User)
+    elif stage == 'recipes':
+        reset_sequence(Recipe)
+        count_media(plan)
+    elif stage == 'relations':
+        count_followers(plan)
@@ -0,0 +1,134 @@
+"""Модуль ленты рецептов авторов, на которых подписан пользователь.
+
+Лента хранится в таблице TimelineEntry и заполняется при записи:
+новый рецепт добавляется в ленты всех подписчиков автора. Для авторов
+с числом подписчиков больше FEED_FANOUT_MAX_FOLLOWERS рассылка
+не выполняется, их рецепты читаются из таблицы рецептов и сливаются
+с лентой при ее выдаче, чтение ленты ничего не записывает. При подписке
+в ленту переносятся последние рецепты автора, при отписке они
+удаляются. В ленте хранится не больше FEED_MAX_ENTRIES новых записей,
+более старые удаляются при добавлении.
+"""
+
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from api.constants import (FEED_BACKFILL_SIZE, FEED_BATCH_SIZE,
+                           FEED_FANOUT_MAX_FOLLOWERS, FEED_MAX_ENTRIES)
+from django.contrib.auth import get_user_model
+from django.db.models import F, OuterRef, Q, Subquery
+from recipes.models import Recipe, Subscription, TimelineEntry
+
+User = get_user_model()
+
+
+def is_fanout_author(followers_count):
+    """Проверяет, рассылаются ли рецепты автора при публикации."""
+    return followers_count <= FEED_FANOUT_MAX_FOLLOWERS
+
+
+def add_entries(entries):
+    """Добавляет записи в ленты, пропуская уже существующие."""
+    TimelineEntry.objects.bulk_create(
+        entries, ignore_conflicts=True, batch_size=FEED_BATCH_SIZE
+    )
+
+
+def trim(user_ids):
+    """Удаляет из лент пользователей записи старше FEED_MAX_ENTRIES новых.
+
+    Для пачки пользователей одним запросом читается первая лишняя запись
+    каждой ленты (проход по индексу до нее), затем лишние записи
+    всех переполненных лент удаляются одним запросом.
+    """
+    entries = TimelineEntry.objects.filter(
+        user=OuterRef('pk')
+    ).order_by('-pub_date', '-recipe')[FEED_MAX_ENTRIES:FEED_MAX_ENTRIES + 1]
+    user_ids = iter(user_ids)
+    while batch := list(islice(user_ids, FEED_BATCH_SIZE)):
+        bounds = User.objects.filter(pk__in=batch).annotate(
+            bound_date=Subquery(entries.values('pub_date')),
+            bound_recipe=Subquery(entries.values('recipe_id')),
+        ).filter(bound_date__isnull=False).values_list(
+            'pk', 'bound_date', 'bound_recipe'
+        )
+        conditions = [
+            Q(user_id=user_id, pub_date__lt=pub_date)
+            | Q(user_id=user_id, pub_date=pub_date, recipe_id__lte=recipe_id)
+            for user_id, pub_date, recipe_id in bounds
+        ]
+        if conditions:
+            TimelineEntry.objects.filter(reduce(or_, conditions)).delete()
+
+
+def fan_out(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if not is_fanout_author(recipe.author.followers_count):
+        return
+    user_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True))
+    add_entries([
+        TimelineEntry(
+            user_id=user_id, recipe=recipe, author_id=recipe.author_id,
+            pub_date=recipe.pub_date,
+        )
+        for user_id in user_ids
+    ])
+    trim(user_ids)
+
+
+def backfill(user_id, author_ids):
+    """Добавляет в ленту последние рецепты авторов."""
+    add_entries([
+        TimelineEntry(
+            user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+            pub_date=pub_date,
+        )
+        for recipe_id, author_id, pub_date in Recipe.objects.filter(
+            author_id__in=author_ids
+        ).latest_per_author(FEED_BACKFILL_SIZE).values_list(
+            'id', 'author_id', 'pub_date'
+        )
+    ])
+    trim([user_id])
+
+
+def subscribe(user_id, author_ids):
+    """Учитывает нового подписчика авторов и наполняет его ленту."""
+    User.objects.filter(pk__in=author_ids).update(
+        followers_count=F('followers_count') + 1
+    )
+    backfill(user_id, author_ids)
+
+
+def unsubscribe(user_id, author_ids):
+    """Учитывает отписку от авторов и удаляет их рецепты из ленты."""
+    User.objects.filter(
+        pk__in=author_ids, followers_count__gt=0
+    ).update(followers_count=F('followers_count') - 1)
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+def get_timeline(user):
+    """Возвращает источники ленты пользователя.
+
+    Первый источник - записи ленты, второй (если есть подписки
+    на авторов без рассылки) - рецепты этих авторов. В обоих у объектов
+    есть поля recipe_id и pub_date, по ним источники сливаются при
+    курсорной пагинации от новых рецептов к старым.
+    """
+    sources = [TimelineEntry.objects.filter(user=user).only(
+        'id', 'recipe_id', 'pub_date'
+    )]
+    authors = Subscription.objects.filter(
+        user=user, author__followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS
+    ).values('author_id')
+    if authors.exists():
+        sources.append(Recipe.objects.filter(
+            author_id__in=authors
+        ).annotate(recipe_id=F('id')).only('id', 'pub_date'))
+    return sources
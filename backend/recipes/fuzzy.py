@@ -0,0 +1,69 @@
+"""Модуль нечеткого поиска по триграммам.
+
+Сходство строк считается так же, как в расширении pg_trgm PostgreSQL:
+отношение числа общих триграмм к числу триграмм в объединении.
+TrigramIndex - инвертированный индекс триграмм в памяти процесса
+с ограниченным числом просматриваемых кандидатов, чтобы время ответа
+не зависело от частоты триграмм запроса.
+"""
+
+import re
+from collections import Counter, defaultdict
+
+from api.constants import (FUZZY_MAX_CANDIDATES, FUZZY_SCAN_BUDGET,
+                           TRIGRAM_SIMILARITY_THRESHOLD)
+
+
+def trigrams(text):
+    """Возвращает множество триграмм слов строки, как pg_trgm."""
+    result = set()
+    for word in re.findall(r'\w+', text.casefold().replace('ё', 'е')):
+        padded = f'  {word} '
+        result.update(
+            padded[index:index + 3] for index in range(len(padded) - 2)
+        )
+    return frozenset(result)
+
+
+class TrigramIndex:
+    """Инвертированный индекс триграмм для набора строк."""
+
+    def __init__(self, texts):
+        """Строит индекс, позиции строк совпадают с порядком в texts."""
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for position, text in enumerate(texts):
+            grams = trigrams(text)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(position)
+
+    def search(self, query, limit=None,
+               threshold=TRIGRAM_SIMILARITY_THRESHOLD):
+        """Возвращает пары (сходство, позиция) по убыванию сходства.
+
+        Списки позиций просматриваются от редких триграмм к частым,
+        пока не исчерпан бюджет FUZZY_SCAN_BUDGET, после чего
+        сходство считается только для FUZZY_MAX_CANDIDATES лучших
+        кандидатов.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        counts = Counter()
+        budget = FUZZY_SCAN_BUDGET
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            positions = self.postings.get(gram, ())
+            if len(positions) > budget:
+                break
+            budget -= len(positions)
+            counts.update(positions)
+        scored = []
+        for position, common in counts.most_common(FUZZY_MAX_CANDIDATES):
+            similarity = common / (
+                len(grams) + self.sizes[position] - common
+            )
+            if similarity >= threshold:
+                scored.append((similarity, position))
+        scored.sort(key=lambda item: -item[0])
+        return scored[:limit] if limit is not None else scored
@@ -0,0 +1,415 @@
+"""Модуль фоновой обработки загруженных изображений.
+
+Base64ImageField проверяет в запросе только заголовок изображения,
+сохраняет полученную строку Base64 в каталог IMAGE_STAGING_ROOT
+и возвращает StagedImage. После сохранения объекта файл
+переименовывается в задачу (recipes.recipe.<id>.image.<токен>.b64),
+а после фиксации транзакции передается в пул процессов. Там
+изображение декодируется, проверяется Pillow, поворачивается по EXIF
+и очищается от метаданных, уменьшается до IMAGE_MAX_SIDE
+и перекодируется в JPEG (или PNG при наличии прозрачности). Готовый
+файл сохраняется в хранилище поля, и только после этого поле модели
+указывает на него.
+
+Если у модели есть поле <поле>_renditions (Recipe.image_renditions),
+там же создаются уменьшенные копии IMAGE_RENDITIONS в форматах
+IMAGE_RENDITION_FORMATS. Они сохраняются в хранилище поля (имя
+в подкаталоге renditions хранилище по содержимому заменяет хэшем),
+а их имена записываются в это поле ({размер: {расширение: имя файла}}).
+
+Пока изображение не обработано, ответ на запрос записи указывает
+на адрес задачи (см. read_pending): по нему отдается загруженное
+изображение, а после обработки - перенаправление на готовый файл.
+
+Задачи, оставшиеся после перезапуска, обрабатывает команда
+process_images, копии для уже загруженных изображений создает команда
+create_image_renditions.
+"""
+
+import base64
+import io
+import logging
+import os
+import posixpath
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from api.constants import (IMAGE_JPEG_QUALITY, IMAGE_MAX_SIDE,
+                           IMAGE_RENDITION_FORMATS, IMAGE_RENDITIONS,
+                           IMAGE_SNIFF_LENGTH, IMAGE_WEBP_QUALITY)
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+STAGED_SUFFIX = '.b64'
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+ENCODER_OPTIONS = {
+    'JPEG': {
+        'quality': IMAGE_JPEG_QUALITY, 'optimize': True, 'progressive': True,
+    },
+    'WEBP': {'quality': IMAGE_WEBP_QUALITY, 'method': 6},
+    'PNG': {'optimize': True},
+}
+
+executor = None
+
+
+class StagedImage:
+    """Изображение, сохраненное для обработки вне запроса."""
+
+    def __init__(self, path):
+        """Запоминает путь к файлу с данными Base64."""
+        self.path = path
+
+    def __repr__(self):
+        """Возвращает строковое представление для отладки."""
+        return f'StagedImage({self.path!r})'
+
+
+def sniff_image(header):
+    """Возвращает MIME-тип изображения по первым байтам или None."""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    return None
+
+
+def check_image(payload):
+    """Проверяет по заголовку, что строка Base64 содержит изображение.
+
+    Декодируется только начало строки, поэтому проверка не зависит
+    от размера изображения; полностью изображение проверяется при
+    обработке. Ошибки IMAGE_ERRORS означают, что это не изображение.
+    """
+    header = base64.b64decode(payload[:IMAGE_SNIFF_LENGTH], validate=True)
+    if sniff_image(header) is None:
+        raise ValueError('Неизвестный формат изображения.')
+
+
+def stage_image(payload):
+    """Сохраняет строку Base64 без декодирования и возвращает StagedImage."""
+    os.makedirs(settings.IMAGE_STAGING_ROOT, exist_ok=True)
+    path = os.path.join(
+        settings.IMAGE_STAGING_ROOT, uuid.uuid4().hex + STAGED_SUFFIX
+    )
+    with open(path, 'w', encoding='ascii', errors='replace') as staged:
+        staged.write(payload)
+    return StagedImage(path)
+
+
+def has_alpha(image):
+    """Проверяет, есть ли у изображения прозрачность."""
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def encode(image, image_format):
+    """Кодирует изображение в формат Pillow и возвращает содержимое."""
+    output = io.BytesIO()
+    image.save(output, image_format, **ENCODER_OPTIONS[image_format])
+    return output.getvalue()
+
+
+def flatten(image):
+    """Накладывает прозрачное изображение на белый фон для JPEG."""
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def make_renditions(image):
+    """Возвращает уменьшенные копии изображения.
+
+    Результат - словарь {размер: {расширение: содержимое}}. Копии
+    не бывают больше исходного изображения.
+    """
+    image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    renditions = {}
+    for name, side in IMAGE_RENDITIONS:
+        copy = image.copy()
+        copy.thumbnail((side, side))
+        renditions[name] = {
+            extension: encode(
+                copy if image_format == 'WEBP' else flatten(copy),
+                image_format
+            )
+            for extension, image_format in IMAGE_RENDITION_FORMATS
+        }
+    return renditions
+
+
+def process_image(path, renditions=False):
+    """Декодирует, проверяет и перекодирует изображение из файла задачи.
+
+    Выполняется в отдельном процессе и не обращается к базе данных.
+    Возвращает содержимое нового файла, его расширение и уменьшенные
+    копии (пустой словарь, если renditions=False).
+    """
+    with open(path, 'rb') as staged:
+        content = base64.b64decode(staged.read(), validate=True)
+    with Image.open(io.BytesIO(content)) as image:
+        image.verify()
+    with Image.open(io.BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        if has_alpha(image):
+            content, extension = encode(image.convert('RGBA'), 'PNG'), 'png'
+        else:
+            content, extension = encode(image.convert('RGB'), 'JPEG'), 'jpg'
+        return (
+            content, extension, make_renditions(image) if renditions else {}
+        )
+
+
+def render_file(content):
+    """Возвращает уменьшенные копии сохраненного изображения."""
+    with Image.open(io.BytesIO(content)) as image:
+        return make_renditions(ImageOps.exif_transpose(image))
+
+
+def get_job_path(instance, field_name, staged):
+    """Возвращает путь задачи для поля объекта."""
+    token = os.path.basename(staged.path)[:-len(STAGED_SUFFIX)]
+    return os.path.join(
+        settings.IMAGE_STAGING_ROOT,
+        f'{instance._meta.label_lower}.{instance.pk}.{field_name}.{token}'
+        f'{STAGED_SUFFIX}'
+    )
+
+
+def parse_job_path(path):
+    """Возвращает модель, id объекта, поле и токен задачи или None."""
+    parts = os.path.basename(path)[:-len(STAGED_SUFFIX)].split('.')
+    if len(parts) != 5:
+        return None
+    app_label, model_name, pk, field_name, token = parts
+    return apps.get_model(app_label, model_name), pk, field_name, token
+
+
+def get_renditions_field(model, field_name):
+    """Возвращает имя поля уменьшенных копий изображения или None."""
+    name = f'{field_name}_renditions'
+    try:
+        model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return name
+
+
+def get_job(path):
+    """Возвращает функцию обработки изображения задачи."""
+    model, _, field_name, _ = parse_job_path(path)
+    return partial(
+        process_image, path,
+        get_renditions_field(model, field_name) is not None
+    )
+
+
+def save_renditions(field_file, renditions):
+    """Сохраняет копии рядом с изображением и возвращает их имена."""
+    directory, filename = posixpath.split(field_file.name)
+    stem = os.path.splitext(filename)[0]
+    return {
+        name: {
+            extension: field_file.storage.save(
+                posixpath.join(
+                    directory, 'renditions', f'{stem}.{name}.{extension}'
+                ),
+                ContentFile(content),
+            )
+            for extension, content in formats.items()
+        }
+        for name, formats in renditions.items()
+    }
+
+
+def get_auto_now_fields(model):
+    """Возвращает поля модели, обновляемые при каждом сохранении."""
+    return [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+    ]
+
+
+def set_renditions(instance, field_name, renditions):
+    """Сохраняет копии изображения поля и записывает их в объект.
+
+    Возвращает имена измененных полей или пустой список, если у поля
+    нет копий.
+    """
+    renditions_field = get_renditions_field(type(instance), field_name)
+    if renditions_field is None:
+        return []
+    setattr(instance, renditions_field, save_renditions(
+        getattr(instance, field_name), renditions
+    ))
+    return [renditions_field]
+
+
+def save_image(path, content, extension, renditions):
+    """Сохраняет обработанное изображение и указывает на него в поле."""
+    model, pk, field_name, token = parse_job_path(path)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    getattr(instance, field_name).save(
+        f'{token}.{extension}', ContentFile(content), save=False
+    )
+    instance.save(update_fields=[
+        field_name,
+        *set_renditions(instance, field_name, renditions),
+        *get_auto_now_fields(model),
+    ])
+
+
+def run_job(path, get_result=None):
+    """Обрабатывает задачу и удаляет ее файл.
+
+    Файл некорректного изображения удаляется с записью в журнал.
+    При других ошибках (например, недоступности базы данных) файл
+    остается и будет обработан командой process_images.
+    """
+    if get_result is None:
+        get_result = get_job(path)
+    try:
+        result = get_result()
+    except IMAGE_ERRORS as error:
+        logger.warning('Изображение %s не обработано: %s', path, error)
+    else:
+        save_image(path, *result)
+    os.unlink(path)
+
+
+def complete_job(path, future):
+    """Завершает задачу, выполненную в пуле процессов."""
+    try:
+        run_job(path, future.result)
+    except BrokenProcessPool:
+        reset_executor()
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    """Возвращает пул процессов, создавая его при первом обращении.
+
+    Пул создается в каждом процессе gunicorn после его запуска.
+    """
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return executor
+
+
+def reset_executor():
+    """Сбрасывает пул процессов после его аварийного завершения."""
+    global executor
+    executor = None
+
+
+def submit_job(path):
+    """Передает задачу в пул процессов или выполняет ее сразу."""
+    if not settings.IMAGE_WORKERS:
+        run_job(path)
+        return
+    try:
+        future = get_executor().submit(get_job(path))
+    except BrokenProcessPool:
+        reset_executor()
+        future = get_executor().submit(get_job(path))
+    future.add_done_callback(partial(complete_job, path))
+
+
+def schedule_image(instance, field_name, staged):
+    """Ставит обработку изображения поля объекта после фиксации.
+
+    Возвращает путь файла задачи.
+    """
+    path = get_job_path(instance, field_name, staged)
+    os.replace(staged.path, path)
+    transaction.on_commit(partial(submit_job, path), robust=True)
+    return path
+
+
+def pop_staged_images(validated_data):
+    """Извлекает из данных сериализатора изображения для обработки."""
+    return {
+        name: validated_data.pop(name)
+        for name, value in list(validated_data.items())
+        if isinstance(value, StagedImage)
+    }
+
+
+def schedule_images(instance, staged_images):
+    """Ставит обработку извлеченных изображений объекта.
+
+    Возвращает словарь {поле: путь файла задачи}.
+    """
+    return {
+        field_name: schedule_image(instance, field_name, staged)
+        for field_name, staged in staged_images.items()
+    }
+
+
+def get_pending_name(path):
+    """Возвращает имя задачи для адреса еще не обработанного изображения."""
+    return os.path.basename(path)[:-len(STAGED_SUFFIX)]
+
+
+def read_pending(name):
+    """Возвращает содержимое и MIME-тип необработанного изображения.
+
+    Возвращает None, если задачи с таким именем нет (например, она уже
+    выполнена). Имя задачи содержит случайный токен, поэтому его нельзя
+    подобрать.
+    """
+    if os.path.basename(name) != name or name.startswith('.'):
+        return None
+    path = os.path.join(settings.IMAGE_STAGING_ROOT, name + STAGED_SUFFIX)
+    try:
+        with open(path, 'rb') as staged:
+            content = base64.b64decode(staged.read())
+    except (OSError, ValueError):
+        return None
+    return content, sniff_image(content[:IMAGE_SNIFF_LENGTH])
+
+
+def get_processed_url(name):
+    """Возвращает адрес обработанного изображения задачи или None."""
+    try:
+        model, pk, field_name, _ = parse_job_path(name)
+        field_file = getattr(model.objects.get(pk=pk), field_name)
+    except (TypeError, LookupError, ValueError, AttributeError,
+            ObjectDoesNotExist):
+        return None
+    return field_file.url if field_file else None
+
+
+def get_pending_jobs():
+    """Возвращает файлы задач и еще не назначенные загруженные файлы."""
+    try:
+        entries = list(os.scandir(settings.IMAGE_STAGING_ROOT))
+    except FileNotFoundError:
+        return []
+    return [
+        entry for entry in entries
+        if entry.is_file() and entry.name.endswith(STAGED_SUFFIX)
+    ]
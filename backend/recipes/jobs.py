@@ -0,0 +1,144 @@
+"""Модуль очереди фоновых задач.
+
+Очередь хранится в таблице Job и не требует отдельного брокера.
+API создает задачу, команда run_jobs забирает задачи из очереди
+и выполняет их в пуле потоков не больше JOB_WORKERS одновременно.
+Задачи выбираются SELECT ... FOR UPDATE SKIP LOCKED и помечаются
+выполняемыми в той же транзакции, поэтому несколько процессов
+run_jobs не выполнят одну задачу дважды.
+
+Обработчик задачи получает пользователя и параметры задачи и
+возвращает имя и содержимое файла результата (или None). Упавшая
+задача повторяется JOB_MAX_ATTEMPTS раз с растущей задержкой,
+зависшая дольше JOB_TIMEOUT возвращается в очередь. Выполненные
+и окончательно упавшие задачи удаляются через JOB_RESULT_TTL
+секунд вместе с результатом.
+"""
+
+from datetime import timedelta
+
+from api.constants import (JOB_MAX_ATTEMPTS, JOB_RESULT_TTL, JOB_RETRY_DELAY,
+                           JOB_TIMEOUT)
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from recipes.models import Job
+
+JOB_HANDLERS = {
+    'shopping_list': 'api.exports.export_shopping_list',
+    'recipes': 'api.exports.export_recipes',
+    'rebuild_shopping_list': 'api.exports.rebuild_shopping_list',
+}
+JOB_PARAMS = {
+    'shopping_list': {'format': ('txt', 'csv', 'json')},
+    'recipes': {},
+    'rebuild_shopping_list': {},
+}
+
+
+def claim(limit):
+    """Забирает из очереди до limit задач, готовых к выполнению.
+
+    id задач выбираются с блокировкой строк, занятые другими
+    обработчиками строки пропускаются; обновляются и возвращаются
+    ровно выбранные задачи.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        if not connection.features.has_select_for_update:
+            # SQLite блокирует базу целиком: блокировка записи берется
+            # до чтения, иначе ее получение после чтения сразу падает
+            # с ошибкой, пока пишут потоки выполняемых задач.
+            Job.objects.filter(pk=0).update(status=Job.PENDING)
+        ids = list(Job.objects.filter(
+            status=Job.PENDING, run_after__lte=now
+        ).select_for_update(skip_locked=True).order_by(
+            'run_after', 'id'
+        ).values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(
+            status=Job.RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+        return list(Job.objects.filter(id__in=ids).select_related('user'))
+
+
+def finish(job, result):
+    """Сохраняет результат выполненной задачи."""
+    now = timezone.now()
+    if result is not None:
+        filename, content = result
+        if isinstance(content, str):
+            content = content.encode()
+        job.result.save(f'{job.pk}/{filename}', ContentFile(content),
+                        save=False)
+    job.status = Job.DONE
+    job.error = ''
+    job.finished_at = now
+    job.expires_at = now + timedelta(seconds=JOB_RESULT_TTL)
+    job.save()
+
+
+def fail(job, error):
+    """Возвращает задачу в очередь с задержкой или отмечает ошибку."""
+    now = timezone.now()
+    job.error = f'{type(error).__name__}: {error}'
+    if job.attempts < JOB_MAX_ATTEMPTS:
+        job.status = Job.PENDING
+        job.run_after = now + timedelta(
+            seconds=JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        )
+    else:
+        job.status = Job.FAILED
+        job.finished_at = now
+        job.expires_at = now + timedelta(seconds=JOB_RESULT_TTL)
+    job.save()
+
+
+def run(job):
+    """Выполняет задачу и сохраняет результат или ошибку."""
+    handler = import_string(JOB_HANDLERS[job.kind])
+    try:
+        result = handler(job.user, **job.params)
+    except Exception as error:
+        fail(job, error)
+    else:
+        finish(job, result)
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, выполняющиеся дольше JOB_TIMEOUT.
+
+    Такие задачи остались от остановленного процесса run_jobs.
+    Возвращает число возвращенных задач.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        started_at__lt=now - timedelta(seconds=JOB_TIMEOUT),
+    )
+    stale.filter(attempts__gte=JOB_MAX_ATTEMPTS).update(
+        status=Job.FAILED, error='Превышено время выполнения.',
+        finished_at=now, expires_at=now + timedelta(seconds=JOB_RESULT_TTL),
+    )
+    return stale.update(status=Job.PENDING, run_after=now)
+
+
+def expire():
+    """Удаляет задачи с истекшим сроком хранения и их результаты."""
+    expired = Job.objects.filter(expires_at__lt=timezone.now())
+    for job in expired.only('id', 'result').iterator():
+        if job.result:
+            job.result.delete(save=False)
+    return expired.delete()[0]
+
+
+def get_pending_count(user):
+    """Возвращает число незавершенных задач пользователя."""
+    return Job.objects.filter(
+        user=user, status__in=(Job.PENDING, Job.RUNNING)
+    ).count()
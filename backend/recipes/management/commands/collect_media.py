@@ -0,0 +1,32 @@
+"""Модуль для удаления медиафайлов, на которые не осталось ссылок."""
+
+from api.constants import MEDIA_RELEASE_DELAY
+from django.core.management import BaseCommand
+from recipes.media import collect
+
+
+class Command(BaseCommand):
+    """
+    Удаление неиспользуемых медиафайлов.
+
+    Удаляет файлы, на которые больше MEDIA_RELEASE_DELAY секунд
+    (или --delay секунд) не ссылается ни один рецепт и аватар.
+    Задержка нужна, чтобы закэшированные страницы успели
+    перестать ссылаться на файл.
+    """
+
+    help = 'Удаление медиафайлов без ссылок из рецептов и аватаров.'
+
+    def add_arguments(self, parser):
+        """Добавляет параметры команды."""
+        parser.add_argument(
+            '--delay', type=int, default=MEDIA_RELEASE_DELAY,
+            help='Сколько секунд файл должен быть без ссылок.'
+        )
+
+    def handle(self, *args, **options):
+        """Удаляет неиспользуемые файлы и выводит их число."""
+        deleted = collect(options['delay'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено медиафайлов: {len(deleted)}.')
+        )
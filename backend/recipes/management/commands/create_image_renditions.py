@@ -0,0 +1,74 @@
+"""Модуль для создания уменьшенных копий уже загруженных фото рецептов."""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from recipes.images import (IMAGE_ERRORS, get_auto_now_fields, render_file,
+                            set_renditions)
+from recipes.models import Recipe
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    """
+    Создание уменьшенных копий фото рецептов.
+
+    Новые фото получают копии при загрузке, команда создает их для фото,
+    загруженных раньше (или для всех фото с флагом --all). Копии
+    создаются в пуле процессов пачками по BATCH_SIZE рецептов.
+    """
+
+    help = 'Создание уменьшенных копий фото рецептов.'
+
+    def add_arguments(self, parser):
+        """Добавляет параметры команды."""
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=max(settings.IMAGE_WORKERS, 1),
+            help='Число процессов для обработки фото.'
+        )
+
+    def render(self, executor, recipes):
+        """Создает копии фото пачки рецептов и возвращает их число."""
+        futures = {}
+        for recipe in recipes:
+            try:
+                with recipe.image.open('rb') as image:
+                    content = image.read()
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            futures[executor.submit(render_file, content)] = recipe
+        created = 0
+        for future, recipe in futures.items():
+            try:
+                renditions = future.result()
+            except IMAGE_ERRORS as error:
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            recipe.save(update_fields=[
+                *set_renditions(recipe, 'image', renditions),
+                *get_auto_now_fields(Recipe),
+            ])
+            created += 1
+        return created
+
+    def handle(self, *args, **options):
+        """Создает копии фото рецептов без копий."""
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_renditions={})
+        recipes = recipes.only('id', 'image').order_by('pk').iterator()
+        created = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while batch := list(islice(recipes, BATCH_SIZE)):
+                created += self.render(executor, batch)
+        self.stdout.write(
+            self.style.SUCCESS(f'Копии фото созданы для {created} рецептов.')
+        )
@@ -0,0 +1,36 @@
+"""Модуль для выгрузки статических снимков справочников."""
+
+from django.core.management import BaseCommand, CommandError
+from recipes.snapshots import CATALOGS, export_catalog
+
+
+class Command(BaseCommand):
+    """
+    Выгрузка снимков справочников в статические файлы.
+
+    Записывает в каталог CATALOG_SNAPSHOT_ROOT версионированные JSON-файлы
+    тегов и ингредиентов со сжатыми копиями и обновляет manifest.json.
+    Запускается при развертывании; после изменения справочников снимки
+    пересоздаются автоматически.
+    """
+
+    help = 'Выгрузка снимков тегов и ингредиентов в статические файлы.'
+
+    def add_arguments(self, parser):
+        """Позволяет выгрузить только указанные справочники."""
+        parser.add_argument(
+            'catalogs', nargs='*',
+            help=f'Справочники для выгрузки: {", ".join(CATALOGS)} '
+                 '(по умолчанию все).'
+        )
+
+    def handle(self, *args, **options):
+        """Создает снимки и выводит их адреса."""
+        unknown = set(options['catalogs']) - set(CATALOGS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные справочники: {", ".join(sorted(unknown))}.'
+            )
+        for name in options['catalogs'] or CATALOGS:
+            url = export_catalog(name)
+            self.stdout.write(self.style.SUCCESS(f'{name}: {url}'))
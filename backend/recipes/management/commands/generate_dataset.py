@@ -0,0 +1,129 @@
+"""Модуль для генерации синтетического набора данных."""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from api.constants import DATASET_BATCH_SIZE
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections
+from recipes.cache import invalidate_all_recipe_cards
+from recipes.dataset import (STAGES, finish_stage, get_plan, get_tasks,
+                             init_worker, run_task)
+
+
+class Command(BaseCommand):
+    """
+    Генерация синтетического набора данных для нагрузочной проверки.
+
+    Добавляет к данным в базе пользователей, рецепты, избранное,
+    корзины и подписки (см. recipes.dataset). С одним и тем же
+    --seed и размерами набор данных получается одинаковым, сколько бы
+    процессов ни указывал --workers. Теги и ингредиенты должны быть
+    загружены заранее командами import_tags и import_ingredients.
+    """
+
+    help = 'Генерация синтетических пользователей, рецептов и подписок.'
+
+    def add_arguments(self, parser):
+        """Добавляет параметры команды."""
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Число пользователей.'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=5000,
+            help='Число рецептов.'
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Среднее число рецептов в корзине у пользователя.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=10,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора случайных чисел.'
+        )
+        parser.add_argument(
+            '--password', default='password',
+            help='Пароль всех созданных пользователей.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для генерации.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DATASET_BATCH_SIZE,
+            help='Число пользователей или рецептов в одной пачке.'
+        )
+
+    def run_stage(self, plan, stage, executor):
+        """Генерирует все пачки этапа."""
+        tasks = get_tasks(plan, stage)
+        if executor:
+            # Процессы пула создаются при отправке пачек и не должны
+            # унаследовать открытое соединение с базой.
+            connections.close_all()
+            futures = [executor.submit(run_task, task) for task in tasks]
+            results = (future.result() for future in futures)
+        else:
+            futures = []
+            results = map(run_task, tasks)
+        done = 0
+        try:
+            for size in results:
+                done += size
+                self.stdout.write(f'\r{stage}: {done}', ending='')
+        except BaseException:
+            # После ошибки или прерывания оставшиеся пачки не запускаются.
+            for future in futures:
+                future.cancel()
+            raise
+        finish_stage(plan, stage)
+        self.stdout.write(f'\r{stage}: {done}')
+
+    def handle(self, *args, **options):
+        """Генерирует набор данных по этапам."""
+        if options['users'] < 1 or options['recipes'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть больше нуля.')
+        try:
+            plan = get_plan(
+                options['users'], options['recipes'], options['favorites'],
+                options['carts'], options['subscriptions'], options['seed'],
+                make_password(options['password']), options['batch_size'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            self.stderr.write(
+                'SQLite не допускает одновременной записи, '
+                'данные генерируются в одном процессе.'
+            )
+            options['workers'] = 1
+        executor = None
+        if options['workers'] > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'], initializer=init_worker,
+                initargs=(plan,),
+            )
+        else:
+            init_worker(plan)
+        try:
+            for stage in STAGES:
+                self.run_stage(plan, stage, executor)
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+        invalidate_all_recipe_cards()
+        self.stdout.write(self.style.SUCCESS(
+            f'Созданы пользователи с id от {plan["user_base"]} и рецепты '
+            f'с id от {plan["recipe_base"]}.'
+        ))
@@ -1,42 +1,20 @@
-"""Модуль для импорта готовой базы CSV-файла с ингридиентами."""
+"""Модуль для импорта готовой базы ингридиентов из CSV или JSON файла."""
 
-import os
-from csv import reader
-
-from django.conf import settings
-from django.core.management import BaseCommand
+from recipes.catalog_import import ImportCatalogCommand
 from recipes.models import Ingredient
 
 
-class Command(BaseCommand):
+class Command(ImportCatalogCommand):
     """
-    Загрузка данных из CSV файла в базу данных.
+    Загрузка списка ингредиентов в базу данных.
 
-    Загружает список ингредиентов из CSV файла в базу данных.
-    Каждая строка CSV файла содержит название
-    ингредиента и его единицу измерения. Если ингредиент уже существует в
-    базе, его данные обновляются. В противном случае, создается новая запись.
+    Каждая строка CSV файла содержит название ингредиента и его единицу
+    измерения, объект JSON файла - поля name и measurement_unit.
+    Ингредиенты сопоставляются по названию: у существующего ингредиента
+    обновляется единица измерения, новые ингредиенты добавляются.
+    С флагом --dry-run команда только выводит изменения.
     """
 
-    help = 'Загрузка списка ингредиентов из csv-файла в базу данных.'
-
-    def handle(self, *args, **options):
-        """
-        Чтение данных из CSV файла и их загрузка в базу данных.
-
-        Читает файл ingredients.csv, обрабатывает каждую строку и загружает
-        ингредиенты в модель Ingredient. Используется метод update_or_create,
-        чтобы избежать дублирования записей.
-        """
-        file_path = os.path.join(
-            settings.BASE_DIR, '..', 'data', 'ingredients.csv'
-        )
-
-        with open(file_path, encoding='utf-8') as csv_file:
-            csv_reader = reader(csv_file)
-            for row in csv_reader:
-                Ingredient.objects.update_or_create(
-                    name=row[0].strip(),
-                    measurement_unit=row[1].strip()
-                )
-        self.stdout.write(self.style.SUCCESS('Список ингредиентов загружен!'))
+    help = 'Загрузка списка ингредиентов из CSV или JSON файла в базу данных.'
+    model = Ingredient
+    default_file = 'ingredients.csv'
@@ -0,0 +1,36 @@
+"""Модуль для обработки изображений, оставшихся в каталоге загрузок."""
+
+import os
+import time
+
+from api.constants import IMAGE_STAGING_TTL
+from django.core.management import BaseCommand
+from recipes.images import get_pending_jobs, parse_job_path, run_job
+
+
+class Command(BaseCommand):
+    """
+    Обработка изображений из каталога IMAGE_STAGING_ROOT.
+
+    Обрабатывает задачи, не завершенные пулом процессов (например, из-за
+    перезапуска сервера), и удаляет загруженные файлы, так и не
+    назначенные объекту (запрос с ошибкой или отмененная транзакция),
+    старше IMAGE_STAGING_TTL секунд.
+    """
+
+    help = 'Обработка изображений, ожидающих в каталоге загрузок.'
+
+    def handle(self, *args, **options):
+        """Обрабатывает задачи и удаляет устаревшие файлы."""
+        processed = removed = 0
+        for entry in get_pending_jobs():
+            if parse_job_path(entry.path) is not None:
+                run_job(entry.path)
+                processed += 1
+            elif entry.stat().st_mtime < time.time() - IMAGE_STAGING_TTL:
+                os.unlink(entry.path)
+                removed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, '
+            f'удалено файлов: {removed}.'
+        ))
@@ -0,0 +1,70 @@
+"""Модуль для выполнения фоновых задач пользователей."""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from api.constants import JOB_POLL_INTERVAL, JOB_WORKERS
+from django.core.management import BaseCommand
+from django.db import connections
+from recipes.jobs import claim, expire, requeue_stale, run
+
+
+def run_in_thread(job):
+    """Выполняет задачу и закрывает соединения потока с базой."""
+    try:
+        run(job)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """
+    Выполнение фоновых задач из очереди Job.
+
+    Забирает из очереди не больше задач, чем свободных потоков, и
+    опрашивает очередь каждые JOB_POLL_INTERVAL секунд. Перед опросом
+    возвращает в очередь зависшие задачи и удаляет устаревшие
+    результаты. С флагом --once выполняет готовые задачи и завершается.
+    """
+
+    help = 'Выполнение фоновых задач пользователей.'
+
+    def add_arguments(self, parser):
+        """Добавляет параметры команды."""
+        parser.add_argument(
+            '--workers', type=int, default=JOB_WORKERS,
+            help='Число одновременно выполняемых задач.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        """Выполняет задачи до остановки процесса."""
+        workers = max(options['workers'], 1)
+        running = set()
+        completed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                requeue_stale()
+                expire()
+                jobs = claim(workers - len(running))
+                running.update(
+                    executor.submit(run_in_thread, job) for job in jobs
+                )
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(JOB_POLL_INTERVAL)
+                    continue
+                done, running = wait(
+                    running, timeout=JOB_POLL_INTERVAL,
+                    return_when=FIRST_COMPLETED
+                )
+                completed += len(done)
+                for future in done:
+                    future.result()
+        self.stdout.write(
+            self.style.SUCCESS(f'Выполнено задач: {completed}.')
+        )
@@ -0,0 +1,52 @@
+"""Модуль для проверки и пересчета списков покупок."""
+
+from django.core.management import BaseCommand, CommandError
+from recipes.shopping_list import check, rebuild
+
+
+class Command(BaseCommand):
+    """
+    Проверка и пересчет таблицы списков покупок.
+
+    Сравнивает суммы ингредиентов, накопленные инкрементально,
+    с пересчитанными по рецептам в корзинах. С флагом --rebuild
+    пересчитывает списки пользователей с расхождениями
+    (или всех пользователей вместе с --all).
+    """
+
+    help = 'Проверка и пересчет списков покупок пользователей.'
+
+    def add_arguments(self, parser):
+        """Добавляет параметры команды."""
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Проверить только пользователя с указанным id.'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать списки с расхождениями.'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Вместе с --rebuild пересчитать все списки.'
+        )
+
+    def handle(self, *args, **options):
+        """Проверяет списки и при необходимости пересчитывает их."""
+        if options['rebuild'] and options['all']:
+            rebuild(options['users'])
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок пересчитаны.')
+            )
+            return
+        broken = check(options['users'])
+        if not broken:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено.'))
+            return
+        users = ', '.join(map(str, broken))
+        if not options['rebuild']:
+            raise CommandError(f'Расхождения в списках покупок: {users}.')
+        rebuild(broken)
+        self.stdout.write(
+            self.style.SUCCESS(f'Списки покупок пересчитаны: {users}.')
+        )
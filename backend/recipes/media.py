@@ -0,0 +1,121 @@
+"""Модуль подсчета ссылок на медиафайлы.
+
+Файлы хранилища могут быть общими у нескольких рецептов и аватаров
+(см. recipes.storage), поэтому удалить файл вместе с объектом нельзя.
+Вместо этого таблица MediaBlob хранит число ссылок на каждый файл:
+обработчики сигналов сохранения и удаления рецептов и пользователей
+прибавляют ссылки на новые файлы и вычитают ссылки на прежние.
+Файл без ссылок помечается датой освобождения и удаляется командой
+collect_media, если за MEDIA_RELEASE_DELAY секунд на него не появилось
+новых ссылок.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from api.constants import MEDIA_RELEASE_DELAY
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from recipes.models import MediaBlob
+
+MEDIA_FIELDS = {
+    'recipes.recipe': ('image', 'image_renditions'),
+    'users.user': ('avatar',),
+}
+
+
+def get_field_names(value):
+    """Возвращает имена файлов из значения поля.
+
+    Значение - файл, имя файла или словарь копий изображения
+    вида {размер: {расширение: имя файла}}.
+    """
+    if isinstance(value, dict):
+        return [
+            name for nested in value.values()
+            for name in get_field_names(nested)
+        ]
+    name = getattr(value, 'name', value)
+    return [name] if name else []
+
+
+def get_media_names(instance):
+    """Возвращает счетчик имен файлов, на которые ссылается объект."""
+    return Counter(
+        name for field in MEDIA_FIELDS[instance._meta.label_lower]
+        for name in get_field_names(getattr(instance, field))
+    )
+
+
+def get_stored_media_names(model, pk):
+    """Возвращает счетчик имен файлов объекта по данным в базе."""
+    values = model.objects.filter(pk=pk).values(
+        *MEDIA_FIELDS[model._meta.label_lower]
+    ).first() or {}
+    return Counter(
+        name for value in values.values() for name in get_field_names(value)
+    )
+
+
+def change_references(deltas):
+    """Прибавляет к числу ссылок на файлы разности {имя файла: число}.
+
+    Файлы, у которых не осталось ссылок, помечаются датой освобождения,
+    у снова используемых файлов отметка снимается.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name) for name in deltas], ignore_conflicts=True
+        )
+        blobs = MediaBlob.objects.filter(name__in=deltas)
+        blobs.update(references=Greatest(
+            F('references') + Case(
+                *(When(name=name, then=Value(delta))
+                  for name, delta in deltas.items()),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ))
+        blobs.filter(references=0, released_at=None).update(
+            released_at=timezone.now()
+        )
+        blobs.filter(references__gt=0).exclude(released_at=None).update(
+            released_at=None
+        )
+
+
+def update_references(previous, current):
+    """Переносит в счетчики ссылок замену файлов объекта."""
+    deltas = Counter(current)
+    deltas.subtract(previous)
+    change_references(deltas)
+
+
+def collect(delay=MEDIA_RELEASE_DELAY):
+    """Удаляет файлы, освобожденные больше delay секунд назад.
+
+    Запись каждого файла блокируется, и если на файл так и не появилось
+    ссылок, удаляется вместе с файлом, пока блокировка удерживается:
+    хранилище проверяет наличие файла под той же блокировкой (см.
+    ContentAddressedStorage.reserve). Возвращает имена удаленных файлов.
+    """
+    deleted = []
+    released_before = timezone.now() - timedelta(seconds=delay)
+    released = MediaBlob.objects.filter(
+        references=0, released_at__lt=released_before
+    )
+    for name in list(released.values_list('name', flat=True)):
+        with transaction.atomic():
+            blob = released.filter(name=name).select_for_update().first()
+            if blob is None:
+                continue
+            blob.delete()
+            default_storage.delete(name)
+        deleted.append(name)
+    return deleted
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+MAX_TAGS = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    """Назначает биты существующим тегам и считает маски рецептов.
+
+    Теги рецептов записывались только в RecipeTag, поэтому маска
+    считается по RecipeTag, а недостающие строки связи Recipe.tags,
+    по которой теги читаются, дописываются из него.
+    """
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    if Tag.objects.count() > MAX_TAGS:
+        raise RuntimeError(
+            f'Маска тегов вмещает не больше {MAX_TAGS} тегов, '
+            'удалите лишние теги перед миграцией.'
+        )
+    tags = list(Tag.objects.order_by('id'))
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ('bit',))
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    Through = Recipe.tags.through
+    bits = {tag.pk: tag.bit for tag in tags}
+    masks = {}
+    for recipe_id, tag_id in RecipeTag.objects.values_list(
+        'recipe_id', 'tag_id'
+    ).iterator():
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bits[tag_id]
+    Through.objects.bulk_create([
+        Through(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id, tag_id in RecipeTag.objects.order_by().values_list(
+            'recipe_id', 'tag_id'
+        ).difference(Through.objects.values_list('recipe_id', 'tag_id'))
+    ], batch_size=1000, ignore_conflicts=True)
+    recipes = list(Recipe.objects.only('pk'))
+    for recipe in recipes:
+        recipe.tags_mask = masks.get(recipe.pk, 0)
+    Recipe.objects.bulk_update(recipes, ('tags_mask',), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Битовая маска тегов рецепта, см. Tag.bit.', verbose_name='Маска тегов'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, help_text='Номер бита тега в маске тегов рецепта.', null=True, unique=True, verbose_name='Бит тега'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
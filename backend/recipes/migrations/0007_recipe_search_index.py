@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:40
+
+from django.db import migrations
+from recipes.search import install_search_index, uninstall_search_index
+
+
+def install(apps, schema_editor):
+    """Создает полнотекстовый индекс рецептов."""
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    """Удаляет полнотекстовый индекс рецептов."""
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_tag_bit_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-17 07:05
+
+from django.db import migrations
+from recipes.search import install_trigram_index, uninstall_trigram_index
+
+
+def install(apps, schema_editor):
+    """Создает индекс триграмм названий рецептов."""
+    install_trigram_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    """Удаляет индекс триграмм названий рецептов."""
+    uninstall_trigram_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
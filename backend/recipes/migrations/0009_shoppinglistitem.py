@@ -0,0 +1,82 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Min, Sum
+
+
+def remove_cart_duplicates(apps, schema_editor):
+    """Оставляет по одной записи рецепта в списке покупок."""
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    keep = ShoppingCart.objects.values('user', 'recipe').annotate(
+        keep=Min('id')
+    ).values('keep')
+    ShoppingCart.objects.exclude(id__in=keep).delete()
+
+
+def fill_shopping_lists(apps, schema_editor):
+    """Считает списки покупок по рецептам в корзинах."""
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values('recipe__shopping_cart__user', 'ingredient').annotate(
+        total=Sum('amount')
+    )
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(
+                user_id=row['recipe__shopping_cart__user'],
+                ingredient_id=row['ingredient'], amount=row['total']
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.BigIntegerField(default=0, verbose_name='Количество')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списка покупок',
+            },
+        ),
+        migrations.RunPython(
+            remove_cart_duplicates, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistitem',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistitem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(
+            fill_shopping_lists, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+FEED_BACKFILL_SIZE = 50
+
+
+def fill_timelines(apps, schema_editor):
+    """Считает подписчиков авторов и наполняет ленты по подпискам."""
+    User = apps.get_model('users', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('recipes', 'Subscription')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    User.objects.update(followers_count=Coalesce(Subquery(
+        Subscription.objects.filter(author=OuterRef('pk')).values(
+            'author'
+        ).annotate(count=Count('id')).values('count')
+    ), 0))
+    for author_id in Subscription.objects.values_list(
+        'author_id', flat=True
+    ).distinct():
+        recipes = list(Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:FEED_BACKFILL_SIZE])
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for user_id in Subscription.objects.filter(
+                    author_id=author_id
+                ).values_list('user_id', flat=True)
+                for recipe_id, pub_date in recipes
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_shoppinglistitem'),
+        ('users', '0002_user_followers_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'indexes': [models.Index(fields=['user', '-pub_date', '-id'], name='timeline_user_pub_date_idx'), models.Index(fields=['user', 'author'], name='timeline_user_author_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:41
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_favorite_duplicates(apps, schema_editor):
+    """Оставляет по одной записи рецепта в избранном."""
+    FavoriteRecipe = apps.get_model('recipes', 'FavoriteRecipe')
+    keep = FavoriteRecipe.objects.values('user', 'recipe').annotate(
+        keep=Min('id')
+    ).values('keep')
+    FavoriteRecipe.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_favorite_duplicates, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_favoriterecipe_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Файлы уменьшенных копий фото, см. recipes.images.', verbose_name='Размеры фото рецепта'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:52
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    """Считает ссылки рецептов и аватаров на уже загруженные файлы."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    MediaBlob = apps.get_model('recipes', 'MediaBlob')
+    references = Counter()
+    for image, renditions in Recipe.objects.values_list(
+        'image', 'image_renditions'
+    ).iterator():
+        references.update(
+            name for name in (
+                image,
+                *(name for formats in renditions.values()
+                  for name in formats.values()),
+            ) if name
+        )
+    references.update(
+        User.objects.exclude(avatar='').exclude(avatar=None).values_list(
+            'avatar', flat=True
+        ).iterator()
+    )
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, references=count)
+         for name, count in references.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_image_renditions'),
+        ('users', '0002_user_followers_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('released_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата освобождения')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+                'indexes': [models.Index(condition=models.Q(('references', 0)), fields=['released_at'], name='mediablob_released_idx')],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
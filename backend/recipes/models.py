@@ -1,9 +1,18 @@
 """Модуль с моделями данных."""
-from api.constants import MAX_LENGTH_LONG, MAX_LENGTH_SHORT
+from functools import reduce
+from operator import or_
+
+from api.constants import MAX_LENGTH_LONG, MAX_LENGTH_SHORT, MAX_TAGS
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import F, Q
+from django.db import connections, models
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch, Q,
+                              Value, Window)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from recipes.search import search_recipes
+from recipes.storage import get_job_result_storage
 
 User = get_user_model()
 
@@ -27,6 +36,13 @@ class Tag(models.Model):
         max_length=MAX_LENGTH_SHORT,
         help_text='Укажите короткое имя (slug).'
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит тега',
+        unique=True,
+        null=True,
+        editable=False,
+        help_text='Номер бита тега в маске тегов рецепта.'
+    )
 
     class Meta():
         """Метаданные модели."""
@@ -39,6 +55,36 @@ class Tag(models.Model):
         """Возвращает строковое представление тега."""
         return f'Тэг {self.name}'
 
+    def clean(self):
+        """Не дает создать тег сверх MAX_TAGS."""
+        if self.bit is None:
+            Tag.get_free_bits(1)
+
+    def save(self, *args, **kwargs):
+        """Назначает новому тегу наименьший свободный бит маски."""
+        if self.bit is None:
+            self.bit = Tag.get_free_bits(1)[0]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_free_bits(count):
+        """Возвращает count наименьших свободных битов маски."""
+        used = set(Tag.objects.exclude(bit=None).values_list('bit', flat=True))
+        free = [bit for bit in range(MAX_TAGS) if bit not in used][:count]
+        if len(free) < count:
+            raise ValidationError(f'Нельзя создать больше {MAX_TAGS} тегов!')
+        return free
+
+    @property
+    def mask(self):
+        """Битовая маска тега."""
+        return 1 << self.bit
+
+    @staticmethod
+    def mask_of(tags):
+        """Возвращает битовую маску набора тегов."""
+        return reduce(or_, (tag.mask for tag in tags), 0)
+
 
 class Ingredient(models.Model):
     """Модель ингридиентов рецептов."""
@@ -67,6 +113,92 @@ class Ingredient(models.Model):
         return f'Ингридиент {self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов.
+
+    Собирает выборку для отображения рецептов за фиксированное число
+    запросов к базе данных, независимо от размера страницы.
+    """
+
+    def with_user_flags(self, user):
+        """Аннотирует признак подписки текущего пользователя на автора.
+
+        Признаки избранного и корзины берутся из закэшированных наборов
+        рецептов пользователя, см. recipes.cache.get_user_recipes.
+        """
+        if not user or not user.is_authenticated:
+            return self.annotate(
+                author_is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    @staticmethod
+    def card_prefetches():
+        """Связи, необходимые для сборки карточки рецепта."""
+        return (
+            'tags',
+            Prefetch(
+                'ingredients_recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ).order_by('ingredient__name'),
+            ),
+        )
+
+    def with_tags_mask(self, mask, match_all=False):
+        """Фильтрует рецепты по маске тегов.
+
+        По умолчанию рецепт должен содержать хотя бы один из тегов маски,
+        при match_all - все теги маски.
+        """
+        recipes = self.alias(tags_bits=F('tags_mask').bitand(mask))
+        if match_all:
+            return recipes.filter(tags_bits=mask)
+        return recipes.exclude(tags_bits=0)
+
+    def update_tags_mask(self):
+        """Пересчитывает маску тегов рецептов по их связям с тегами."""
+        recipes = list(self.prefetch_related('tags'))
+        for recipe in recipes:
+            recipe.tags_mask = Tag.mask_of(recipe.tags.all())
+        self.model.objects.bulk_update(recipes, ('tags_mask',))
+
+    def search(self, query, fuzzy=False):
+        """Полнотекстовый поиск по названию и описанию рецепта.
+
+        Аннотирует ранг search_rank, см. recipes.search. При fuzzy
+        добавляются рецепты с похожим названием (поиск с опечатками).
+        """
+        return search_recipes(self, query, connections[self.db], fuzzy)
+
+    def latest_per_author(self, limit=None):
+        """Новые рецепты каждого автора, не больше limit на автора.
+
+        Ограничение применяется в базе данных оконной функцией
+        ROW_NUMBER() по автору, поэтому рецепты нескольких авторов
+        читаются одним запросом.
+        """
+        ordering = (F('pub_date').desc(), F('id').desc())
+        recipes = self.order_by('author', *ordering)
+        if limit is None:
+            return recipes
+        return recipes.annotate(row_number=Window(
+            RowNumber(), partition_by=F('author'), order_by=ordering
+        )).filter(row_number__lte=limit)
+
+    def with_related(self, user):
+        """Подгружает автора и признаки текущего пользователя.
+
+        Теги и ингредиенты догружаются одним запросом на связь только для
+        рецептов, отсутствующих в кэше карточек, см. recipes.cache.
+        """
+        return self.select_related('author').with_user_flags(user)
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -87,6 +219,13 @@ class Recipe(models.Model):
         upload_to='media/',
         help_text='Добавьте фото рецепта.'
     )
+    image_renditions = models.JSONField(
+        verbose_name='Размеры фото рецепта',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Файлы уменьшенных копий фото, см. recipes.images.'
+    )
     text = models.TextField(
         verbose_name='Описани рецепта',
         help_text='Опишите процесс приготовления блюда.'
@@ -114,6 +253,18 @@ class Recipe(models.Model):
         verbose_name='Дата публикации рецепта',
         auto_now_add=True,
     )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False,
+        help_text='Битовая маска тегов рецепта, см. Tag.bit.'
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения рецепта',
+        auto_now=True,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta():
         """Метаданные модели."""
@@ -121,6 +272,12 @@ class Recipe(models.Model):
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление рецепта."""
@@ -190,6 +347,12 @@ class FavoriteRecipe(models.Model):
         ordering = ('user', 'recipe')
         verbose_name = 'Избранные рецепты'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         """Возвращает строковое представление рецепта в избранном."""
@@ -218,12 +381,57 @@ class ShoppingCart(models.Model):
 
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         """Возвращает строковое представление рецепта в списке."""
         return f'Рецепт {self.recipe} в списке {self.user}'
 
 
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Таблица поддерживается инкрементально (см. recipes.shopping_list):
+    при добавлении рецепта в список покупок, удалении из него и изменении
+    ингредиентов рецепта к строкам прибавляется разность количеств.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.BigIntegerField('Количество', default=0)
+
+    class Meta:
+        """Метаданные модели."""
+
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        """Возвращает строковое представление позиции списка."""
+        return f'{self.ingredient} — {self.amount} в списке {self.user}'
+
+
 class Subscription(models.Model):
     """Подписки пользователя на авторов рецептов."""
 
@@ -260,6 +468,61 @@ class Subscription(models.Model):
         return f'Пользователь {self.user} подписан на {self.author}'
 
 
+class TimelineEntry(models.Model):
+    """Запись ленты рецептов авторов, на которых подписан пользователь.
+
+    Записи создаются при публикации рецепта для всех подписчиков автора
+    (см. recipes.feed). Дата публикации продублирована из рецепта, чтобы
+    лента читалась одним проходом по индексу (user, -pub_date, -recipe).
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        """Метаданные модели."""
+
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_recipe_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        """Возвращает строковое представление записи ленты."""
+        return f'Рецепт {self.recipe} в ленте {self.user}'
+
+
 class RecipeTag(models.Model):
     """Тэги для рецептов."""
 
@@ -288,3 +551,115 @@ class RecipeTag(models.Model):
     def __str__(self):
         """Возвращает строковое представление тега."""
         return f'Тэг {self.tag} для рецепта {self.recipe}'
+
+
+class MediaBlob(models.Model):
+    """Число ссылок на медиафайл из рецептов и аватаров.
+
+    Файлы хранятся по содержимому (см. recipes.storage) и могут быть
+    общими у нескольких объектов. Файл без ссылок удаляется командой
+    collect_media не раньше, чем через MEDIA_RELEASE_DELAY секунд
+    после освобождения.
+    """
+
+    name = models.CharField(
+        'Имя файла',
+        max_length=255,
+        primary_key=True
+    )
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+    released_at = models.DateTimeField(
+        'Дата освобождения',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        """Метаданные модели."""
+
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+        indexes = [
+            models.Index(
+                fields=('released_at',),
+                condition=models.Q(references=0),
+                name='mediablob_released_idx'
+            )
+        ]
+
+    def __str__(self):
+        """Возвращает имя файла и число ссылок."""
+        return f'{self.name} ({self.references})'
+
+
+class Job(models.Model):
+    """Фоновая задача пользователя.
+
+    Задачи выполняет команда run_jobs (см. recipes.jobs). Результат
+    задачи - файл в закрытом хранилище, который удаляется вместе
+    с задачей после expires_at.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        related_name='jobs',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    kind = models.CharField('Тип задачи', max_length=MAX_LENGTH_SHORT)
+    params = models.JSONField('Параметры', default=dict, blank=True)
+    status = models.CharField(
+        'Состояние',
+        max_length=MAX_LENGTH_SHORT,
+        choices=STATUSES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField('Число попыток', default=0)
+    run_after = models.DateTimeField(
+        'Не раньше', default=timezone.now
+    )
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    started_at = models.DateTimeField('Дата запуска', null=True, blank=True)
+    finished_at = models.DateTimeField(
+        'Дата завершения', null=True, blank=True
+    )
+    expires_at = models.DateTimeField(
+        'Хранится до', null=True, blank=True
+    )
+    error = models.TextField('Ошибка', blank=True)
+    result = models.FileField(
+        'Результат',
+        upload_to='jobs',
+        storage=get_job_result_storage,
+        blank=True
+    )
+
+    class Meta:
+        """Метаданные модели."""
+
+        ordering = ('-created_at', '-id')
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(
+                fields=('run_after',),
+                condition=models.Q(status='pending'),
+                name='job_pending_idx'
+            ),
+            models.Index(fields=('expires_at',), name='job_expires_idx'),
+        ]
+
+    def __str__(self):
+        """Возвращает тип и состояние задачи."""
+        return f'Задача {self.kind} ({self.status}) для {self.user}'
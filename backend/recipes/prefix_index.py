@@ -0,0 +1,132 @@
+"""Модуль префиксного индекса ингредиентов в памяти процесса.
+
+Индекс - отсортированный массив нормализованных названий ингредиентов,
+поиск по префиксу выполняется двоичным поиском без обращения к базе.
+Если по префиксу найдено слишком мало ингредиентов, результаты
+дополняются нечетким поиском по триграммам (см. recipes.fuzzy).
+Индекс строится при запуске процесса (см. foodgram.wsgi) и
+перестраивается, когда меняется метка версии справочника ингредиентов
+(см. recipes.cache). Метка читается из кэша не чаще одного раза
+в INGREDIENT_INDEX_CHECK_INTERVAL секунд, поэтому поиск обычно
+не обращается ни к кэшу, ни к базе; изменения справочника в этом же
+процессе учитываются сразу (см. expire).
+"""
+
+import logging
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from api.constants import (FUZZY_SEARCH_MIN_RESULTS,
+                           INGREDIENT_INDEX_CHECK_INTERVAL)
+from django.db import DatabaseError
+from recipes.cache import get_catalog_version
+from recipes.fuzzy import TrigramIndex
+from recipes.models import Ingredient
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(name):
+    """Приводит название к виду для сравнения без учета регистра и "ё"."""
+    return name.casefold().replace('ё', 'е')
+
+
+class IngredientPrefixIndex:
+    """Префиксный индекс названий ингредиентов."""
+
+    def __init__(self):
+        """Создает пустой индекс, он будет построен при первом поиске."""
+        self.version = None
+        self.checked_at = None
+        self.keys = ()
+        self.items = ()
+        self.fuzzy = TrigramIndex(())
+        self.lock = Lock()
+
+    def build(self, version):
+        """Загружает ингредиенты из базы данных и строит индекс."""
+        rows = sorted(
+            (normalize(name), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        self.keys = tuple(row[0] for row in rows)
+        self.items = tuple(
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in rows
+        )
+        self.fuzzy = TrigramIndex(self.keys)
+        self.version = version
+
+    def ensure_current(self):
+        """Перестраивает индекс, если справочник изменился.
+
+        Метка версии перечитывается, только если с прошлой проверки
+        прошло больше INGREDIENT_INDEX_CHECK_INTERVAL секунд.
+        """
+        checked_at = self.checked_at
+        now = time.monotonic()
+        if (checked_at is not None
+                and now - checked_at < INGREDIENT_INDEX_CHECK_INTERVAL):
+            return
+        version = get_catalog_version(Ingredient)
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.build(version)
+        self.checked_at = now
+
+    def get_version(self):
+        """Возвращает метку версии справочника, по которой построен индекс.
+
+        Метка обновляется так же редко, как в ensure_current, поэтому
+        ее можно вычислять для каждого запроса автодополнения.
+        """
+        self.ensure_current()
+        return self.version
+
+    def expire(self):
+        """Проверяет версию справочника при следующем поиске."""
+        self.checked_at = None
+
+    def warm(self):
+        """Строит индекс заранее, чтобы первый поиск не ждал загрузки.
+
+        Если база недоступна, индекс будет построен при первом поиске.
+        """
+        try:
+            self.ensure_current()
+        except DatabaseError as error:
+            logger.warning('Индекс ингредиентов не построен: %s', error)
+
+    def search(self, prefix, limit=None):
+        """Возвращает ингредиенты, названия которых начинаются с префикса.
+
+        Если найдено меньше FUZZY_SEARCH_MIN_RESULTS ингредиентов,
+        к ним добавляются похожие названия по убыванию сходства.
+        """
+        self.ensure_current()
+        normalized = normalize(prefix)
+        keys, items = self.keys, self.items
+        start = bisect_left(keys, normalized)
+        positions = []
+        for index in range(start, len(keys)):
+            if limit is not None and len(positions) >= limit:
+                break
+            if not keys[index].startswith(normalized):
+                break
+            positions.append(index)
+        if len(positions) < FUZZY_SEARCH_MIN_RESULTS:
+            found = set(positions)
+            positions.extend(
+                position for _, position in self.fuzzy.search(prefix)
+                if position not in found
+            )
+            if limit is not None:
+                positions = positions[:limit]
+        return [items[position] for position in positions]
+
+
+ingredient_index = IngredientPrefixIndex()
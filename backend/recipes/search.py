@@ -0,0 +1,246 @@
+"""Модуль полнотекстового поиска рецептов.
+
+Индекс поддерживается средствами базы данных и не описан в моделях,
+чтобы не загружать его вместе с рецептами:
+- PostgreSQL: столбец tsvector с русской морфологией, GIN-индекс и триггер;
+- SQLite: внешняя таблица FTS5 и триггеры синхронизации.
+В остальных СУБД поиск выполняется по вхождению подстроки.
+
+Нечеткий поиск по названию рецепта с опечатками использует в PostgreSQL
+расширение pg_trgm и GIN-индекс триграмм, в остальных СУБД - индекс
+триграмм названий в памяти процесса (см. recipes.fuzzy).
+"""
+
+import re
+from threading import Lock
+
+from api.constants import FUZZY_MAX_CANDIDATES
+from django.db.models import (BooleanField, Case, Count, FloatField, Max, Q,
+                              Value, When)
+from django.db.models.expressions import RawSQL
+from recipes.fuzzy import TrigramIndex
+
+POSTGRESQL_INSTALL = (
+    'ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector '
+    'tsvector',
+    '''
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'CREATE TRIGGER recipes_recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()',
+    'UPDATE recipes_recipe SET name = name WHERE search_vector IS NULL',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+POSTGRESQL_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+POSTGRESQL_TRIGRAM_INSTALL = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_name_trgm_idx '
+    'ON recipes_recipe USING gin (name gin_trgm_ops)',
+)
+POSTGRESQL_TRIGRAM_UNINSTALL = (
+    'DROP INDEX IF EXISTS recipes_recipe_name_trgm_idx',
+)
+
+SQLITE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5("
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    ''',
+)
+SQLITE_REBUILD = (
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')"
+)
+SQLITE_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def execute_all(connection, statements):
+    """Выполняет набор SQL-выражений."""
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install_search_index(connection):
+    """Создает поисковый индекс рецептов и наполняет его."""
+    if connection.vendor == 'postgresql':
+        execute_all(connection, POSTGRESQL_INSTALL)
+    elif connection.vendor == 'sqlite':
+        execute_all(
+            connection, (SQLITE_TABLE, *SQLITE_TRIGGERS, SQLITE_REBUILD)
+        )
+
+
+def uninstall_search_index(connection):
+    """Удаляет поисковый индекс рецептов."""
+    if connection.vendor == 'postgresql':
+        execute_all(connection, POSTGRESQL_UNINSTALL)
+    elif connection.vendor == 'sqlite':
+        execute_all(connection, SQLITE_UNINSTALL)
+
+
+def install_trigram_index(connection):
+    """Создает индекс триграмм названий рецептов в PostgreSQL."""
+    if connection.vendor == 'postgresql':
+        execute_all(connection, POSTGRESQL_TRIGRAM_INSTALL)
+
+
+def uninstall_trigram_index(connection):
+    """Удаляет индекс триграмм названий рецептов в PostgreSQL."""
+    if connection.vendor == 'postgresql':
+        execute_all(connection, POSTGRESQL_TRIGRAM_UNINSTALL)
+
+
+def restore_sqlite_triggers(connection):
+    """Восстанавливает триггеры FTS5 после пересоздания таблицы.
+
+    Миграции SQLite пересоздают таблицу рецептов при изменении столбцов,
+    и ее триггеры удаляются вместе со старой таблицей.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'recipes_recipe_fts'"
+            )
+            if cursor.fetchone():
+                execute_all(connection, SQLITE_TRIGGERS)
+
+
+def sqlite_match_query(query):
+    """Преобразует строку поиска в запрос FTS5 по префиксам слов."""
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class RecipeNameIndex:
+    """Индекс триграмм названий рецептов в памяти процесса.
+
+    Используется для нечеткого поиска в СУБД без pg_trgm. Перестраивается,
+    когда меняются число рецептов или дата последнего изменения.
+    """
+
+    def __init__(self):
+        """Создает пустой индекс, он будет построен при первом поиске."""
+        self.version = None
+        self.ids = ()
+        self.index = TrigramIndex(())
+        self.lock = Lock()
+
+    def search(self, model, query):
+        """Возвращает пары (сходство, id рецепта) для похожих названий."""
+        version = tuple(model.objects.aggregate(
+            updated=Max('updated_at'), count=Count('id')
+        ).values())
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    rows = list(model.objects.values_list('id', 'name'))
+                    self.ids = tuple(pk for pk, _ in rows)
+                    self.index = TrigramIndex(name for _, name in rows)
+                    self.version = version
+        ids = self.ids
+        return [
+            (similarity, ids[position])
+            for similarity, position in self.index.search(
+                query, FUZZY_MAX_CANDIDATES
+            )
+        ]
+
+
+recipe_name_index = RecipeNameIndex()
+
+
+def search_recipes(queryset, query, connection, fuzzy=False):
+    """Фильтрует рецепты по строке поиска и аннотирует ранг search_rank.
+
+    Чем больше search_rank, тем релевантнее рецепт. При fuzzy к найденным
+    по тексту добавляются рецепты с похожим названием.
+    """
+    if connection.vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('russian', %s)"
+        rank = f'ts_rank(recipes_recipe.search_vector, {tsquery})'
+        match = f'recipes_recipe.search_vector @@ {tsquery}'
+        if fuzzy:
+            return queryset.annotate(search_rank=RawSQL(
+                f'GREATEST({rank}, similarity(recipes_recipe.name, %s))',
+                (query, query), output_field=FloatField()
+            )).filter(RawSQL(
+                f'({match} OR recipes_recipe.name %% %s)', (query, query),
+                output_field=BooleanField()
+            ))
+        return queryset.annotate(search_rank=RawSQL(
+            rank, (query,), output_field=FloatField()
+        )).filter(RawSQL(match, (query,), output_field=BooleanField()))
+    if fuzzy:
+        similar = recipe_name_index.search(queryset.model, query)
+        matches = search_recipes(queryset.model.objects.all(), query,
+                                 connection).values('pk')
+        return queryset.annotate(search_rank=Case(
+            *(When(pk=pk, then=Value(similarity))
+              for similarity, pk in similar),
+            default=Value(0.0), output_field=FloatField()
+        )).filter(Q(pk__in=[pk for _, pk in similar]) | Q(pk__in=matches))
+    if connection.vendor == 'sqlite':
+        match = sqlite_match_query(query)
+        if not match:
+            return queryset.annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            ).none()
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT rowid FROM recipes_recipe_fts '
+            'WHERE recipes_recipe_fts MATCH %s', (match,)
+        )).annotate(search_rank=RawSQL(
+            '(SELECT -bm25(recipes_recipe_fts, 10.0, 1.0) '
+            'FROM recipes_recipe_fts WHERE recipes_recipe_fts MATCH %s '
+            'AND recipes_recipe_fts.rowid = recipes_recipe.id)',
+            (match,), output_field=FloatField()
+        ))
+    return queryset.annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    ).filter(Q(name__icontains=query) | Q(text__icontains=query))
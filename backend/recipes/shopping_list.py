@@ -0,0 +1,182 @@
+"""Модуль инкрементального списка покупок.
+
+Таблица ShoppingListItem хранит для каждого пользователя суммарное
+количество каждого ингредиента из рецептов его списка покупок.
+Изменения вносятся разностями: вектор ингредиентов рецепта
+({id ингредиента: количество}) прибавляется при добавлении рецепта
+в список, вычитается при удалении, а при изменении ингредиентов
+рецепта разность прибавляется всем пользователям с этим рецептом
+в списке. Стоимость изменения пропорциональна числу ингредиентов
+рецепта, а не размеру списка.
+
+Функция rebuild() пересчитывает таблицу из списков покупок
+и используется командой shopping_lists.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+def get_vector(recipe_id):
+    """Возвращает вектор ингредиентов рецепта."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def scale(vector, factor):
+    """Умножает вектор ингредиентов на число."""
+    return {key: amount * factor for key, amount in vector.items()}
+
+
+def apply_delta(user_ids, delta):
+    """Прибавляет разность количеств к спискам покупок пользователей.
+
+    Недостающие строки создаются, строки с нулевым и отрицательным
+    количеством удаляются. Выполняется не более трех запросов.
+    """
+    delta = {key: amount for key, amount in delta.items() if amount}
+    if not user_ids or not delta:
+        return
+    with transaction.atomic():
+        added = [key for key, amount in delta.items() if amount > 0]
+        if added:
+            ShoppingListItem.objects.bulk_create(
+                [
+                    ShoppingListItem(user_id=user_id, ingredient_id=key)
+                    for user_id in user_ids for key in added
+                ],
+                ignore_conflicts=True, batch_size=BATCH_SIZE,
+            )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=delta
+        )
+        items.update(amount=F('amount') + Case(
+            *(When(ingredient_id=key, then=Value(amount))
+              for key, amount in delta.items()),
+            output_field=BigIntegerField(),
+        ))
+        if len(added) < len(delta):
+            items.filter(amount__lte=0).delete()
+
+
+def add_recipe(user_id, recipe_id, factor=1):
+    """Добавляет ингредиенты рецепта в список покупок пользователя.
+
+    С factor=-1 вычитает их при удалении рецепта из списка.
+    """
+    apply_delta([user_id], scale(get_vector(recipe_id), factor))
+
+
+def add_recipes(user_id, recipe_ids, factor=1):
+    """Добавляет ингредиенты нескольких рецептов одной разностью."""
+    apply_delta([user_id], scale(dict(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(
+        total=Sum('amount')
+    ).values_list('ingredient_id', 'total')), factor))
+
+
+def change_recipes(deltas):
+    """Применяет изменения ингредиентов рецептов к спискам покупок.
+
+    deltas - словарь {id рецепта: разность векторов ингредиентов}.
+    Пользователи с одинаковыми разностями обновляются вместе.
+    """
+    deltas = {
+        recipe_id: delta for recipe_id, delta in deltas.items()
+        if any(delta.values())
+    }
+    if not deltas:
+        return
+    users = defaultdict(Counter)
+    for user_id, recipe_id in ShoppingCart.objects.filter(
+        recipe_id__in=deltas
+    ).values_list('user_id', 'recipe_id'):
+        users[user_id].update(deltas[recipe_id])
+    groups = defaultdict(list)
+    for user_id, delta in users.items():
+        groups[frozenset(delta.items())].append(user_id)
+    for delta, user_ids in groups.items():
+        apply_delta(user_ids, dict(delta))
+
+
+def diff(old, new):
+    """Возвращает разность двух векторов ингредиентов."""
+    return {
+        key: new.get(key, 0) - old.get(key, 0)
+        for key in old.keys() | new.keys()
+    }
+
+
+def get_rows(user):
+    """Возвращает строки списка покупок пользователя по названиям."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name').iterator()
+
+
+def get_expected(user_ids=None):
+    """Считает списки покупок по рецептам в корзинах.
+
+    Возвращает словарь {(id пользователя, id ингредиента): количество}.
+    """
+    lookups = {'recipe__shopping_cart__isnull': False}
+    if user_ids is not None:
+        lookups['recipe__shopping_cart__user_id__in'] = user_ids
+    return {
+        (row['recipe__shopping_cart__user'], row['ingredient']):
+            row['total']
+        for row in RecipeIngredient.objects.filter(**lookups).values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).filter(total__gt=0)
+    }
+
+
+def get_stored(user_ids=None):
+    """Возвращает сохраненные строки списков покупок."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in items.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        )
+    }
+
+
+def check(user_ids=None):
+    """Возвращает id пользователей с расхождениями в списках покупок."""
+    expected = get_expected(user_ids)
+    stored = get_stored(user_ids)
+    return sorted({
+        user_id for user_id, ingredient_id in expected.keys() | stored.keys()
+        if expected.get((user_id, ingredient_id))
+        != stored.get((user_id, ingredient_id))
+    })
+
+
+def rebuild(user_ids=None):
+    """Пересчитывает списки покупок пользователей целиком."""
+    with transaction.atomic():
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for (user_id, ingredient_id), amount
+                in get_expected(user_ids).items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
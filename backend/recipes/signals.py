@@ -0,0 +1,274 @@
+"""Модуль обработчиков сигналов моделей рецептов."""
+
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.cache import (bump_catalog_version, invalidate_all_recipe_cards,
+                           invalidate_recipe_cards, invalidate_user_recipes)
+from recipes.feed import fan_out, subscribe, unsubscribe
+from recipes.media import (MEDIA_FIELDS, get_media_names,
+                           get_stored_media_names, update_references)
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingCart,
+                            Subscription, Tag)
+from recipes.prefix_index import ingredient_index
+from recipes.shopping_list import add_recipe, add_recipes, change_recipes
+from recipes.snapshots import schedule_catalog_export
+
+User = get_user_model()
+
+AUTH_ONLY_FIELDS = frozenset(('last_login', 'password'))
+
+
+def is_own_deletion(sender, origin):
+    """Проверяет, что удаляются сами объекты модели, а не каскадно."""
+    return isinstance(origin, sender) or (
+        isinstance(origin, QuerySet) and origin.model is sender
+    )
+
+
+def deleted_together(name, sender, instance, origin):
+    """Возвращает удаляемые объекты, которые должен обработать получатель.
+
+    При удалении набором QuerySet сигнал pre_delete отправляется для
+    каждого объекта с одним и тем же origin, поэтому получатель name
+    обрабатывает весь набор при первом сигнале, а для остальных
+    получает пустой список. При одиночном и каскадном удалении
+    возвращается сам объект.
+    """
+    if not (isinstance(origin, QuerySet) and origin.model is sender):
+        return [instance]
+    handled = origin.__dict__.setdefault('handled_receivers', set())
+    if name in handled:
+        return []
+    handled.add(name)
+    return list(origin)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """Сбрасывает карточку измененного или удаленного рецепта."""
+    invalidate_recipe_cards([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def bump_recipes_version(sender, instance, **kwargs):
+    """Обновляет метку удаления рецептов после фиксации транзакции.
+
+    Удаление не меняет дату изменения оставшихся рецептов, поэтому
+    Last-Modified списка учитывает эту метку.
+    """
+    transaction.on_commit(
+        lambda: bump_catalog_version(Recipe), robust=True
+    )
+
+
+def touch_recipes(recipes):
+    """Обновляет дату изменения рецептов, не меняя их содержимого."""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTag)
+def invalidate_recipe_relation(sender, instance, **kwargs):
+    """Сбрасывает карточку рецепта при изменении его связей."""
+    invalidate_recipe_cards([instance.recipe_id])
+    touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Сбрасывает карточки при изменении тегов через связь ManyToMany."""
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+        invalidate_recipe_cards([instance.pk])
+        recipes.update_tags_mask()
+        touch_recipes(recipes)
+        return
+    if action == 'post_add':
+        mask = F('tags_mask').bitor(instance.mask)
+    else:
+        mask = F('tags_mask').bitand(~instance.mask)
+    if pk_set:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+        invalidate_recipe_cards(pk_set)
+    else:
+        recipes = Recipe.objects.with_tags_mask(instance.mask)
+        invalidate_all_recipe_cards()
+    recipes.update(tags_mask=mask, updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Tag)
+def release_tag_bit(sender, instance, **kwargs):
+    """Снимает бит удаляемого тега с масок рецептов.
+
+    Бит освобождается вместе с тегом и достается следующему новому
+    тегу, поэтому в масках рецептов его не должно остаться.
+    """
+    if instance.bit is not None:
+        Recipe.objects.with_tags_mask(instance.mask).update(
+            tags_mask=F('tags_mask').bitand(~instance.mask)
+        )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает карточки рецептов автора при изменении его профиля.
+
+    Сохранения, затрагивающие только служебные поля (например, время
+    последнего входа), карточки не меняют и пропускаются.
+    """
+    if created or (update_fields and update_fields <= AUTH_ONLY_FIELDS):
+        return
+    invalidate_recipe_cards(instance.recipes.values_list('pk', flat=True))
+    touch_recipes(instance.recipes.all())
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_catalog(sender, instance, **kwargs):
+    """Сбрасывает все карточки и снимок при изменении справочников."""
+    invalidate_all_recipe_cards()
+    bump_catalog_version(sender)
+    schedule_catalog_export(sender)
+    if sender is Ingredient:
+        transaction.on_commit(ingredient_index.expire)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def add_to_user_recipes(sender, instance, created, **kwargs):
+    """Добавляет рецепт в набор пользователя в кэше."""
+    if created:
+        invalidate_user_recipes(sender, instance.user_id)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_user_recipes(sender, instance, **kwargs):
+    """Удаляет рецепт из набора пользователя в кэше."""
+    invalidate_user_recipes(sender, instance.user_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """Прибавляет ингредиенты рецепта к списку покупок."""
+    if created:
+        add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, origin, **kwargs):
+    """Вычитает ингредиенты рецептов из списков покупок.
+
+    Обработчик вызывается до удаления, в том числе каскадного вместе
+    с рецептом, пока ингредиенты рецепта еще есть в базе.
+    """
+    recipes = defaultdict(list)
+    for item in deleted_together('shopping_list', sender, instance, origin):
+        recipes[item.user_id].append(item.recipe_id)
+    for user_id, recipe_ids in recipes.items():
+        add_recipes(user_id, recipe_ids, -1)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    """Запоминает прежний ингредиент и количество перед изменением."""
+    instance.previous_state = (
+        RecipeIngredient.objects.filter(pk=instance.pk).values_list(
+            'recipe_id', 'ingredient_id', 'amount'
+        ).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def save_recipe_ingredient(sender, instance, **kwargs):
+    """Переносит изменение ингредиента рецепта в списки покупок."""
+    deltas = {instance.recipe_id: {
+        instance.ingredient_id: instance.amount
+    }}
+    if instance.previous_state:
+        recipe_id, ingredient_id, amount = instance.previous_state
+        delta = deltas.setdefault(recipe_id, {})
+        delta[ingredient_id] = delta.get(ingredient_id, 0) - amount
+    change_recipes(deltas)
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def delete_recipe_ingredient(sender, instance, origin, **kwargs):
+    """Вычитает удаляемые ингредиенты рецептов из списков покупок.
+
+    Учитываются только удаления самих ингредиентов рецепта. При удалении
+    рецепта или пользователя списки покупок обновляются обработчиком
+    удаления из корзины, при удалении ингредиента - каскадно.
+    """
+    if not is_own_deletion(sender, origin):
+        return
+    deltas = defaultdict(dict)
+    for item in deleted_together('shopping_list', sender, instance, origin):
+        deltas[item.recipe_id][item.ingredient_id] = -item.amount
+    change_recipes(deltas)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_recipe(sender, instance, created, **kwargs):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def add_subscription(sender, instance, created, **kwargs):
+    """Наполняет ленту рецептами автора при подписке."""
+    if created:
+        subscribe(instance.user_id, [instance.author_id])
+
+
+@receiver(pre_delete, sender=Subscription)
+def remove_subscription(sender, instance, origin, **kwargs):
+    """Удаляет рецепты авторов из ленты при отписке."""
+    authors = defaultdict(list)
+    for subscription in deleted_together('feed', sender, instance, origin):
+        authors[subscription.user_id].append(subscription.author_id)
+    for user_id, author_ids in authors.items():
+        unsubscribe(user_id, author_ids)
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_media(sender, instance, update_fields, **kwargs):
+    """Запоминает файлы объекта перед сохранением.
+
+    Сохранения, не затрагивающие поля файлов, пропускаются.
+    """
+    fields = MEDIA_FIELDS[sender._meta.label_lower]
+    if update_fields is not None and not set(update_fields) & set(fields):
+        instance.previous_media = None
+    elif instance._state.adding:
+        instance.previous_media = Counter()
+    else:
+        instance.previous_media = get_stored_media_names(sender, instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def count_media(sender, instance, **kwargs):
+    """Переносит замену файлов объекта в счетчики ссылок."""
+    if instance.previous_media is not None:
+        update_references(instance.previous_media, get_media_names(instance))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_media(sender, instance, **kwargs):
+    """Вычитает ссылки удаленного объекта на файлы."""
+    update_references(get_media_names(instance), ())
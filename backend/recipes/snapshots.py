@@ -0,0 +1,190 @@
+"""Модуль статических снимков справочников.
+
+Снимок - JSON-файл со списком тегов или ингредиентов в том же виде,
+что и ответ API. Имя файла содержит хэш содержимого
+(например, tags.3f2a9c0d1b4e.json), поэтому файл неизменяем и
+отдается nginx с долгим сроком кэширования. Рядом лежат сжатые копии
+.gz и .br, копия под постоянным именем (tags.json) для адресов API
+и manifest.json с адресами текущих версий.
+
+Снимки пересоздаются командой export_catalogs и автоматически
+после фиксации транзакции, изменившей справочник.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from weakref import WeakKeyDictionary, ref
+
+from api.constants import CATALOG_SNAPSHOT_HASH_LENGTH, CATALOG_SNAPSHOT_KEEP
+from django.conf import settings
+from django.db import transaction
+from recipes.models import Ingredient, Tag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOGS = {
+    'tags': (Tag, ('id', 'name', 'slug')),
+    'ingredients': (Ingredient, ('id', 'name', 'measurement_unit')),
+}
+MANIFEST_NAME = 'manifest.json'
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+manifest_cache = {'key': None, 'manifest': {}}
+pending_exports = WeakKeyDictionary()
+
+
+def get_catalog_name(model):
+    """Возвращает имя снимка для модели справочника."""
+    for name, (catalog_model, _) in CATALOGS.items():
+        if catalog_model is model:
+            return name
+    raise LookupError(f'Нет снимка для модели {model.__name__}.')
+
+
+def dump_catalog(name):
+    """Возвращает содержимое снимка справочника в JSON."""
+    model, fields = CATALOGS[name]
+    return json.dumps(
+        list(model.objects.values(*fields)),
+        ensure_ascii=False, separators=(',', ':'),
+    ).encode()
+
+
+def compress(content):
+    """Возвращает сжатые копии содержимого по расширениям файлов."""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return variants
+
+
+def write_file(path, content):
+    """Атомарно записывает файл, чтобы nginx не отдал его частично."""
+    directory = os.path.dirname(path)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            temp_file.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_with_variants(paths, content):
+    """Записывает файлы вместе со сжатыми копиями.
+
+    Содержимое сжимается один раз для всех файлов.
+    """
+    variants = compress(content)
+    for path in paths:
+        for suffix, compressed in variants.items():
+            write_file(path + suffix, compressed)
+        write_file(path, content)
+
+
+def read_manifest():
+    """Возвращает манифест снимков или пустой словарь."""
+    path = os.path.join(settings.CATALOG_SNAPSHOT_ROOT, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+
+def remove_stale(name, current):
+    """Удаляет старые версии снимка, кроме нескольких последних.
+
+    Несколько прежних версий остаются, чтобы клиенты со старым
+    манифестом успели их загрузить.
+    """
+    root = settings.CATALOG_SNAPSHOT_ROOT
+    prefix = f'{name}.'
+    versions = sorted(
+        (entry for entry in os.scandir(root)
+         if entry.name.startswith(prefix) and entry.name.endswith('.json')
+         and entry.name not in (current, f'{name}.json')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    for entry in versions[CATALOG_SNAPSHOT_KEEP - 1:]:
+        for suffix in ('', *COMPRESSED_SUFFIXES):
+            try:
+                os.unlink(entry.path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def export_catalog(name):
+    """Создает снимок справочника и возвращает его адрес."""
+    root = settings.CATALOG_SNAPSHOT_ROOT
+    os.makedirs(root, exist_ok=True)
+    content = dump_catalog(name)
+    digest = hashlib.sha256(content).hexdigest()
+    filename = f'{name}.{digest[:CATALOG_SNAPSHOT_HASH_LENGTH]}.json'
+    path = os.path.join(root, filename)
+    paths = [os.path.join(root, f'{name}.json')]
+    if not os.path.exists(path):
+        paths.insert(0, path)
+    write_with_variants(paths, content)
+    manifest = read_manifest()
+    manifest[name] = {
+        'url': settings.CATALOG_SNAPSHOT_URL + filename,
+        'sha256': digest,
+    }
+    write_file(
+        os.path.join(root, MANIFEST_NAME),
+        json.dumps(manifest, indent=2, sort_keys=True).encode(),
+    )
+    remove_stale(name, filename)
+    return manifest[name]['url']
+
+
+def get_manifest():
+    """Возвращает манифест, перечитывая файл только после его замены."""
+    path = os.path.join(settings.CATALOG_SNAPSHOT_ROOT, MANIFEST_NAME)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    key = (stat.st_ino, stat.st_mtime_ns)
+    if manifest_cache['key'] != key:
+        manifest_cache.update(key=key, manifest=read_manifest())
+    return manifest_cache['manifest']
+
+
+def get_snapshot(name):
+    """Возвращает адрес и хэш текущей версии снимка или None."""
+    return get_manifest().get(name)
+
+
+def schedule_catalog_export(model):
+    """Пересоздает снимок справочника после фиксации транзакции.
+
+    Внутри транзакции снимок каждого справочника пересоздается один раз,
+    сколько бы записей ни изменилось. Ошибка записи снимка не отменяет
+    изменений и только записывается в журнал.
+
+    Для соединения запоминаются слабые ссылки на отложенные пересоздания:
+    при откате транзакции Django отбрасывает отложенные функции, ссылка
+    становится пустой, и следующее изменение снова ставит пересоздание.
+    """
+    name = get_catalog_name(model)
+    pending = pending_exports.setdefault(transaction.get_connection(), {})
+    scheduled = pending.get(name)
+    if scheduled is not None and scheduled() is not None:
+        return
+
+    def export():
+        pending.pop(name, None)
+        export_catalog(name)
+
+    pending[name] = ref(export)
+    transaction.on_commit(export, robust=True)
@@ -0,0 +1,99 @@
+"""Модуль хранилища медиафайлов с именами по содержимому.
+
+Файл сохраняется под именем blobs/<xx>/<sha256><расширение>, где xx -
+первые символы хэша. Одинаковые изображения рецептов, аватаров и их
+уменьшенных копий записываются на диск один раз, а имя файла никогда
+не указывает на другое содержимое, поэтому nginx отдает /media/
+с долгим сроком кэширования.
+
+Ссылки на файлы из моделей считаются в таблице MediaBlob
+(см. recipes.media), неиспользуемые файлы удаляет команда collect_media.
+"""
+
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, именующее файлы по хэшу содержимого."""
+
+    prefix = 'blobs'
+
+    def get_blob_name(self, digest, name):
+        """Возвращает имя файла для хэша и исходного имени."""
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(self.prefix, digest[:2], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        """Оставляет имя без изменений: оно заменяется хэшем в _save."""
+        return name
+
+    def reserve(self, name):
+        """Блокирует запись MediaBlob файла до конца транзакции.
+
+        Запись создается, если ее нет, а у файла без ссылок отметка
+        освобождения переносится на текущее время, чтобы collect_media
+        не удалил файл до того, как на него сошлется сохраняемый объект.
+        """
+        MediaBlob = apps.get_model('recipes', 'MediaBlob')
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name, released_at=timezone.now())],
+            ignore_conflicts=True,
+        )
+        blob = MediaBlob.objects.select_for_update().get(name=name)
+        if not blob.references:
+            blob.released_at = timezone.now()
+            blob.save(update_fields=('released_at',))
+
+    def _save(self, name, content):
+        """Записывает файл, если файла с таким содержимым еще нет.
+
+        Наличие файла проверяется под блокировкой его записи MediaBlob,
+        которую collect_media держит, пока удаляет файл. Файл
+        записывается во временный и переименовывается, поэтому
+        одновременная загрузка одинаковых изображений безопасна.
+        """
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = self.get_blob_name(digest.hexdigest(), name)
+        with transaction.atomic():
+            self.reserve(name)
+            path = self.path(name)
+            if not os.path.exists(path):
+                self.write(path, content)
+        return name
+
+    def write(self, path, content):
+        """Записывает содержимое в файл через временный файл."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def get_job_result_storage():
+    """Возвращает хранилище результатов фоновых задач.
+
+    Каталог JOB_RESULT_ROOT не раздается nginx, файлы отдаются
+    только владельцу задачи через API.
+    """
+    return FileSystemStorage(location=settings.JOB_RESULT_ROOT)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Поддерживается обработчиками подписок, см. recipes.feed.', verbose_name='Число подписчиков'),
+        ),
+    ]
@@ -42,6 +42,12 @@ class User(AbstractUser):
         null=True,
         upload_to='profiles'
     )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False,
+        help_text='Поддерживается обработчиками подписок, см. recipes.feed.'
+    )
 
     class Meta():
         """Метаданные модели."""